@@ -0,0 +1,237 @@
+import os
+from collections import Counter
+from PIL import Image
+from game_profiles import load_catalog, lookup_image_id, profile_path, source_decode_size
+from image_decoder import open_for_size
+from image_overlay import flush_atlas_session, overlay_source, render_card_title
+from tag_force_tiny_thumb_finder import locate_many_in_atlases
+
+# Rough per-operation costs in milliseconds, measured on a desktop PC with
+# Tag Force sized textures. Only used to size a batch before running it.
+COST_MS = {
+    "source_decode": 10,
+    "large_texture": 35,   # decode, overlay and save one 512x256 texture
+    "small_texture": 20,   # decode, overlay and save one 256x256 texture
+    "atlas_load": 80,      # decode one 23x17 tiny atlas
+    "atlas_save": 150,     # encode and write one tiny atlas
+}
+
+
+def _image_id_sort_key(image_id):
+    """Sorts numeric image IDs numerically, so neighbouring textures stay together."""
+    return (0, int(image_id), "") if image_id.isdigit() else (1, 0, image_id)
+
+
+def plan_jobs(source_paths, profiles):
+    """
+    Resolves every source image's image ID and tiny atlas slot for each
+    profile, without writing anything.
+
+    Cards are located profile by profile with locate_many_in_atlases, so
+    each atlas is decoded once per profile and only one decoded atlas is
+    held in memory at a time, however many cards are planned.
+
+    Problems are recorded in skipped rather than raised: a missing catalog
+    or tiny folder, or an unreadable atlas, skips the whole profile; a
+    missing or unreadable small texture skips that card.
+
+    Args:
+        source_paths (iterable): Paths to the source images.
+        profiles (list): The game profiles to render (see game_profiles).
+
+    Returns:
+        tuple: (jobs, skipped). Each job is
+        {"source": path, "card_name": str, "targets": [target, ...]} where a
+        target is {"profile", "image_id", "atlas_slot"}. skipped is a list of
+        (source_path, profile_name, reason).
+    """
+    jobs = []
+    skipped = []
+    # {profile_name: [(job, image_id), ...]} still to be located
+    pending = {profile["name"]: [] for profile in profiles}
+
+    # {profile_name: reason} for profiles whose catalog cannot be read
+    unavailable = {}
+    for profile in profiles:
+        try:
+            load_catalog(profile)
+        except (OSError, ValueError) as e:
+            unavailable[profile["name"]] = f"catalog {profile['catalog']} could not be read: {e}"
+
+    for source_path in source_paths:
+        card_name = os.path.splitext(os.path.basename(source_path))[0]
+        job = {"source": source_path, "card_name": card_name, "targets": []}
+        jobs.append(job)
+
+        for profile in profiles:
+            if profile["name"] in unavailable:
+                skipped.append((source_path, profile["name"], unavailable[profile["name"]]))
+                continue
+            image_id = lookup_image_id(profile, card_name)
+            if not image_id:
+                skipped.append((source_path, profile["name"], f"not in {profile['catalog']}"))
+                continue
+            pending[profile["name"]].append((job, image_id))
+
+    for profile in profiles:
+        cards = pending[profile["name"]]
+        if not cards:
+            continue
+        unreadable = set()
+
+        def small_images():
+            # Opens each small texture only while it is shrunk to a needle
+            for index, (job, image_id) in enumerate(cards):
+                try:
+                    with Image.open(profile_path(profile, "small", f"{image_id}.png")) as small_image:
+                        yield index, small_image.convert("RGBA")
+                except Exception as e:
+                    unreadable.add(index)
+                    skipped.append((job["source"], profile["name"], f"small texture {image_id}.png: {e}"))
+
+        try:
+            atlas_slots = locate_many_in_atlases(small_images(), profile_path(profile, "tiny"), profile["layout"])
+        except Exception as e:
+            # A card may live in the unreadable atlas, so no other cell can be trusted
+            skipped.extend((job["source"], profile["name"], f"tiny atlases: {e}")
+                           for index, (job, _) in enumerate(cards) if index not in unreadable)
+            continue
+
+        for index, (job, image_id) in enumerate(cards):
+            if index not in atlas_slots:
+                continue
+            atlas_slot = atlas_slots[index]
+            if not atlas_slot:
+                skipped.append((job["source"], profile["name"], "no matching atlas cell"))
+                continue
+            job["targets"].append({"profile": profile, "image_id": image_id, "atlas_slot": atlas_slot})
+
+    return [job for job in jobs if job["targets"]], skipped
+
+
+def order_jobs(jobs):
+    """
+    Orders jobs for atlas and base texture locality.
+
+    Jobs are grouped by the destination atlas of their first target, then
+    ordered by image ID (base textures are numbered in dump order), so each
+    atlas is loaded and saved once and neighbouring textures are read together.
+    """
+    def sort_key(job):
+        target = job["targets"][0]
+        return (target["profile"]["name"], target["atlas_slot"]["file"], _image_id_sort_key(target["image_id"]))
+
+    return sorted(jobs, key=sort_key)
+
+
+def count_atlas_touches(jobs):
+    """
+    Counts how many times each atlas is loaded and saved when jobs run in the
+    given order, with one atlas held open per profile.
+
+    Returns:
+        Counter: {(profile_name, atlas_file): touches}
+    """
+    touches = Counter()
+    open_atlas = {}
+    for job in jobs:
+        for target in job["targets"]:
+            profile_name = target["profile"]["name"]
+            atlas_file = target["atlas_slot"]["file"]
+            if open_atlas.get(profile_name) != atlas_file:
+                touches[(profile_name, atlas_file)] += 1
+                open_atlas[profile_name] = atlas_file
+    return touches
+
+
+def estimate_cost_ms(jobs, touches):
+    """Estimates the running time of a batch in milliseconds, using COST_MS."""
+    target_count = sum(len(job["targets"]) for job in jobs)
+    atlas_touches = sum(touches.values())
+    return (len(jobs) * COST_MS["source_decode"]
+            + target_count * (COST_MS["large_texture"] + COST_MS["small_texture"])
+            + atlas_touches * (COST_MS["atlas_load"] + COST_MS["atlas_save"]))
+
+
+def print_plan(jobs, skipped, discovery_order_jobs=None):
+    """
+    Prints the job graph (atlas -> cards), the expected atlas touches and an
+    estimated cost.
+
+    Args:
+        jobs (list): The ordered jobs.
+        skipped (list): (source_path, profile_name, reason) for unresolved targets.
+        discovery_order_jobs (list): The same jobs in discovery order, to
+            compare atlas touches against.
+    """
+    print("\n--- Batch plan ---")
+    # {(profile_name, atlas_file): [(job, target), ...]}, in the order each atlas is first used
+    groups = {}
+    for job in jobs:
+        for target in job["targets"]:
+            group = (target["profile"]["name"], target["atlas_slot"]["file"])
+            groups.setdefault(group, []).append((job, target))
+
+    for (profile_name, atlas_file), cards in groups.items():
+        print(f"{profile_name} / {atlas_file}")
+        for job, target in cards:
+            slot = target["atlas_slot"]
+            print(f"  [{target['image_id']}] {job['card_name']} -> cell ({slot['x_index']}, {slot['y_index']})"
+                  f" at ({slot['pixel_x']}, {slot['pixel_y']})")
+
+    if skipped:
+        print(f"\nSkipped targets ({len(skipped)}):")
+        for source_path, profile_name, reason in skipped:
+            print(f"  {profile_name}: {source_path} ({reason})")
+
+    touches = count_atlas_touches(jobs)
+    target_count = sum(len(job["targets"]) for job in jobs)
+    print(f"\nSources: {len(jobs)}  Targets: {target_count}  Atlases: {len(touches)}")
+    print(f"Atlas touches (load + save): {sum(touches.values())} planned", end="")
+    if discovery_order_jobs is not None:
+        print(f", {sum(count_atlas_touches(discovery_order_jobs).values())} in discovery order"
+              f", {target_count} without an open atlas", end="")
+    print()
+    print(f"Estimated cost: {estimate_cost_ms(jobs, touches) / 1000:.1f} s")
+
+
+def run_jobs(jobs, fused=False, title_style=None):
+    """
+    Runs planned jobs in order. Each source is decoded once, and each
+    profile keeps its current atlas open until a job needs a different one.
+
+    Args:
+        jobs (list): The ordered jobs from plan_jobs / order_jobs.
+        fused (bool): Render small thumbnails with the fused mode (no intermediate canvas).
+        title_style (dict): If given (see image_overlay.render_card_title), each card name is
+            typeset once and written into its large textures.
+
+    Returns:
+        int: The number of jobs that failed.
+    """
+    atlas_sessions = {}
+    failed = 0
+    try:
+        for job in jobs:
+            print(f"\n--- Processing {job['source']} ---")
+            try:
+                profiles = [target["profile"] for target in job["targets"]]
+                source_image = open_for_size(job["source"], source_decode_size(profiles))
+                title_image = render_card_title(job["card_name"], title_style)
+                for target in job["targets"]:
+                    profile = target["profile"]
+                    session = atlas_sessions.setdefault(profile["name"], {"path": None, "image": None})
+                    print(f"--- {profile['name']}: overlaying onto image {target['image_id']} ---")
+                    overlay_source(source_image, target["image_id"], profile, fused,
+                                   atlas_slot=target["atlas_slot"], atlas_session=session,
+                                   title_image=title_image)
+                print(f"Successfully processed {job['source']}")
+            except Exception as e:
+                failed += 1
+                print(f"Error processing {job['source']}: {e}")
+    finally:
+        # Save whatever atlases are still open, even if the batch was interrupted
+        for session in atlas_sessions.values():
+            flush_atlas_session(session)
+
+    return failed
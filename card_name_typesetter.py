@@ -1,40 +1,56 @@
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
-from pathvalidate import sanitize_filename
 import os
 
-def create_text_image(name, output_filename=None, font_path="Yu-Gi-Oh! Matrix Regular Small Caps 2.ttf", color="black"):
+DEFAULT_FONT = "Yu-Gi-Oh! Matrix Regular Small Caps 2.ttf"
+
+@lru_cache(maxsize=None)
+def load_font(font_path, font_size):
     """
-    Creates a PNG image with the given text typeset onto a canvas of a specified size.
+    Loads a TrueType font, caching it so a batch only parses each font once.
+    Returns None if the font cannot be loaded.
+    """
+    try:
+        return ImageFont.truetype(font_path, font_size)
+    except IOError:
+        return None
+
+@lru_cache(maxsize=None)
+def warn_missing_font(font_path):
+    """Prints the missing font warning once per font."""
+    print(f"Font at '{font_path}' not found. Using default font.")
+
+@lru_cache(maxsize=None)
+def load_default_font():
+    """Loads Pillow's built-in font once."""
+    return ImageFont.load_default()
+
+def render_title(name, font_path=DEFAULT_FONT, color="black"):
+    """
+    Typesets text onto a transparent 384x48 title strip.
 
     Args:
         name (str): The text to write on the image.
-        output_filename (str): The name of the output PNG file.
         font_path (str): Path to the TTF font file.
         color (str): The color of the text.
-    """
-    if output_filename is None:
-        sanitized_name = sanitize_filename(name)
-        output_filename = f"{sanitized_name}_title.png"
 
+    Returns:
+        PIL.Image.Image: The RGBA title strip.
+    """
     # Create the final canvas
     final_img = Image.new('RGBA', (384, 48), (255, 255, 255, 0))
 
     # --- Font Selection ---
     font_size = 60
-    try:
-        # Use a common font, fallback to default
-        font = ImageFont.truetype(font_path, font_size)
-    except IOError:
-        print(f"Font at '{font_path}' not found. Using default font.")
-        font = ImageFont.load_default()
+    font = load_font(font_path, font_size)
+    if font is None:
+        warn_missing_font(font_path)
+        font = load_default_font()
         # Fallback font sizing is less precise
         bbox = ImageDraw.Draw(Image.new('RGBA', (1,1))).textbbox((0,0), name, font=font)
         text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
         font_size = int(32 * (32 / text_height))
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except IOError:
-            font = ImageFont.load_default()
+        font = load_font("arial.ttf", font_size) or load_default_font()
 
     # --- Text Rendering ---
     # Get the actual bounding box of the text to account for descenders
@@ -58,21 +74,44 @@ def create_text_image(name, output_filename=None, font_path="Yu-Gi-Oh! Matrix Re
     # This position was hardcoded based on the reference image.
     final_img.paste(text_img, (16, 0), mask=text_img)
 
+    return final_img
+
+def create_text_image(name, output_filename=None, font_path=DEFAULT_FONT, color="black"):
+    """
+    Creates a PNG image with the given text typeset onto a canvas of a specified size.
+
+    Args:
+        name (str): The text to write on the image.
+        output_filename (str): The name of the output PNG file.
+        font_path (str): Path to the TTF font file.
+        color (str): The color of the text.
+    """
+    if output_filename is None:
+        from pathvalidate import sanitize_filename
+        sanitized_name = sanitize_filename(name)
+        output_filename = f"{sanitized_name}_title.png"
+
+    final_img = render_title(name, font_path, color)
+
     # --- Save the result ---
     final_img.save(output_filename, "PNG")
     print(f"Image saved as {output_filename}")
     return output_filename
 
-if __name__ == "__main__":
+def main(argv=None, prog=None):
+    """Runs the command line interface. argv defaults to sys.argv[1:]."""
     import argparse
 
-    parser = argparse.ArgumentParser(description="Create an image with typeset text.")
+    parser = argparse.ArgumentParser(prog=prog, description="Create an image with typeset text.")
     parser.add_argument("name", type=str, help="The text to write on the image.")
-    parser.add_argument("--font", type=str, default="Yu-Gi-Oh! Matrix Regular Small Caps 2.ttf", help="Path to the TTF font file.")
+    parser.add_argument("--font", type=str, default=DEFAULT_FONT, help="Path to the TTF font file.")
     parser.add_argument("--color", type=str, default="black", help="The color of the text (e.g., 'black', '#FFFFFF').")
     parser.add_argument("-o", "--output", dest="output_filename", type=str, default=None,
                         help="The name of the output PNG file (default: {name}_title.png)")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     create_text_image(args.name, args.output_filename, args.font, args.color)
+
+if __name__ == "__main__":
+    main()
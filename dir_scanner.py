@@ -0,0 +1,89 @@
+import fnmatch
+import os
+
+
+def iter_files(root, extensions=None, include=None, exclude=None, recursive=True):
+    """
+    Lazily yields the paths of files under a directory as they are found.
+
+    Uses os.scandir so the first results are available immediately, even
+    in folders holding hundreds of thousands of files, and no full listing
+    is ever held in memory. Subdirectories (e.g. sharded dump folders) are
+    walked depth-first when recursive is True. Like os.walk, symlinked
+    directories are not followed (so link cycles cannot loop forever) and
+    unreadable directories are skipped with a warning.
+
+    Args:
+        root (str): The directory to scan.
+        extensions (tuple): File extensions to keep, e.g. ('.png',).
+            Matched case-insensitively. None keeps every file.
+        include (list): Glob patterns; if given, a file name must match at
+            least one of them.
+        exclude (list): Glob patterns; files and subdirectories whose name
+            matches any of them are skipped.
+        recursive (bool): Whether to descend into subdirectories.
+
+    Yields:
+        str: The full path of each matching file.
+
+    Raises:
+        OSError: If root itself cannot be read (e.g. FileNotFoundError).
+    """
+    if extensions is not None:
+        extensions = tuple(ext.lower() for ext in extensions)
+
+    pending = [root]
+    while pending:
+        current = pending.pop()
+        try:
+            entries = os.scandir(current)
+        except OSError as e:
+            if current == root:
+                raise
+            print(f"  Warning: Could not read directory '{current}', skipping it. Error: {e}")
+            continue
+
+        with entries:
+            for entry in entries:
+                if exclude and any(fnmatch.fnmatch(entry.name, pattern) for pattern in exclude):
+                    continue
+
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            pending.append(entry.path)
+                        continue
+                    if entry.is_dir():
+                        # A symlinked directory: not followed, and not a file either
+                        continue
+                except OSError:
+                    continue
+
+                if extensions is not None and not entry.name.lower().endswith(extensions):
+                    continue
+                if include and not any(fnmatch.fnmatch(entry.name, pattern) for pattern in include):
+                    continue
+
+                yield entry.path
+
+
+def main(argv=None, prog=None):
+    """Runs the command line interface. argv defaults to sys.argv[1:]."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog=prog, description="Stream the files in a directory tree.")
+    parser.add_argument("directory", type=str, help="The directory to scan.")
+    parser.add_argument("--ext", action="append", dest="extensions", default=None,
+                        help="Extension to keep (repeatable), e.g. --ext .png")
+    parser.add_argument("--include", action="append", default=None, help="Glob pattern a file name must match (repeatable).")
+    parser.add_argument("--exclude", action="append", default=None, help="Glob pattern to skip (repeatable).")
+    parser.add_argument("--no-recursive", dest="recursive", action="store_false", help="Do not descend into subdirectories.")
+
+    args = parser.parse_args(argv)
+
+    for path in iter_files(args.directory, args.extensions, args.include, args.exclude, args.recursive):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
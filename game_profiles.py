@@ -0,0 +1,151 @@
+import csv
+import os
+
+# --- Layouts ---
+# Every size and position the pipeline uses to turn one piece of card art
+# into a game's textures. All three Tag Force games on PSP share the same
+# card texture formats, so they start from this layout.
+TAG_FORCE_LAYOUT = {
+    # Large texture: the art is resized to source_size, then each
+    # (crop_box, paste_position) region is copied onto a large_size canvas.
+    "source_size": (312, 312),
+    "large_size": (512, 256),
+    "large_regions": [
+        ((0, 0, 312, 240), (0, 0)),
+        ((0, 240, 192, 312), (320, 0)),
+        ((192, 240, 312, 312), (320, 80)),
+    ],
+
+    # Card name: a title_size strip from card_name_typesetter, split into
+    # (crop_box, paste_position) regions of the large texture.
+    "title_size": (384, 48),
+    "title_regions": [
+        ((0, 0, 192, 48), (320, 160)),
+        ((192, 0, 384, 32), (320, 208)),
+        ((192, 32, 384, 48), (0, 240)),
+    ],
+
+    # Small texture: the art is resized to small_art_size, placed at
+    # small_art_position on a small_canvas_size card, and the card is
+    # resized to small_size.
+    "small_art_size": (305, 305),
+    "small_canvas_size": (400, 583),
+    "small_art_position": (48, 106),
+    "small_size": (256, 256),
+
+    # Tiny atlases: a grid of atlas_cols x atlas_rows cells of atlas_cell_size.
+    "atlas_cell_size": (88, 120),
+    "atlas_cols": 23,
+    "atlas_rows": 17,
+}
+
+# --- Profiles ---
+# root holds the game's large/, small/ and tiny/ dumps, and receives its
+# output/ and backup/ folders. catalog maps card names to image IDs.
+PROFILES = {
+    "TF1": {
+        "name": "TF1",
+        "title": "Yu-Gi-Oh! GX Tag Force",
+        "catalog": os.path.join("cardlist", "TF1.csv"),
+        "root": "TF1",
+        "layout": TAG_FORCE_LAYOUT,
+    },
+    "TF5": {
+        "name": "TF5",
+        "title": "Yu-Gi-Oh! 5D's Tag Force 5",
+        "catalog": os.path.join("cardlist", "TF5.csv"),
+        "root": "TF5",
+        "layout": TAG_FORCE_LAYOUT,
+    },
+    "TFSP": {
+        "name": "TFSP",
+        "title": "Yu-Gi-Oh! ARC-V Tag Force Special",
+        "catalog": os.path.join("cardlist", "TFSP.csv"),
+        "root": "TFSP",
+        "layout": TAG_FORCE_LAYOUT,
+    },
+}
+
+# Used when no profile is selected: the original single-game setup with
+# cards.csv and the large/, small/ and tiny/ folders in the working directory.
+DEFAULT_PROFILE = {
+    "name": "default",
+    "title": "Current directory",
+    "catalog": "cards.csv",
+    "root": ".",
+    "layout": TAG_FORCE_LAYOUT,
+}
+
+
+def get_profile(name):
+    """
+    Returns the profile with the given name (case-insensitive).
+    None returns the DEFAULT_PROFILE.
+
+    Raises:
+        KeyError: If there is no such profile.
+    """
+    if name is None:
+        return DEFAULT_PROFILE
+    for profile_name, profile in PROFILES.items():
+        if profile_name.lower() == name.lower():
+            return profile
+    raise KeyError(f"Unknown game profile '{name}'. Available: {', '.join(PROFILES)}")
+
+
+def source_decode_size(profiles):
+    """
+    Returns the smallest (width, height) a source image must keep to render
+    every given profile: the largest of their large and small art sizes.
+    """
+    sizes = [profile["layout"][key] for profile in profiles for key in ("source_size", "small_art_size")]
+    return (max(width for width, _ in sizes), max(height for _, height in sizes))
+
+
+def profile_path(profile, *parts):
+    """Joins path parts onto the profile's root directory."""
+    return os.path.join(profile["root"], *parts)
+
+
+_catalog_cache = {}
+
+def load_catalog(profile):
+    """
+    Loads a profile's card catalog as {card_name: image_id}.
+    When a name appears more than once, the first entry wins.
+    Catalogs are cached, so each CSV is read once per process.
+
+    Raises:
+        FileNotFoundError: If the catalog CSV does not exist.
+    """
+    catalog_path = profile["catalog"]
+    if catalog_path not in _catalog_cache:
+        catalog = {}
+        with open(catalog_path, mode='r', newline='', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile)
+            for row in reader:
+                if len(row) >= 2 and row[0] not in catalog:
+                    catalog[row[0]] = row[1]
+        _catalog_cache[catalog_path] = catalog
+    return _catalog_cache[catalog_path]
+
+
+def lookup_image_id(profile, card_name):
+    """Returns the image ID for a card name in the profile's catalog, or None."""
+    return load_catalog(profile).get(card_name)
+
+
+_card_name_cache = {}
+
+def lookup_card_name(profile, image_id):
+    """
+    Returns the card name for an image ID in the profile's catalog, or None.
+    When several names share an ID, the first one in the catalog wins.
+    """
+    catalog_path = profile["catalog"]
+    if catalog_path not in _card_name_cache:
+        card_names = {}
+        for card_name, catalog_image_id in load_catalog(profile).items():
+            card_names.setdefault(catalog_image_id, card_name)
+        _card_name_cache[catalog_path] = card_names
+    return _card_name_cache[catalog_path].get(image_id)
@@ -0,0 +1,192 @@
+import os
+from PIL import Image
+
+# --- Configuration ---
+# Sources are decoded at no less than REDUCE_MARGIN times the size the
+# pipeline needs, so the final LANCZOS resize still has detail to filter.
+REDUCE_MARGIN = 3
+
+# Ceiling for the pixel data of one decoded source, in MB. JPEGs are decoded
+# at a smaller DCT scale when needed to fit; other formats over it are refused.
+# Override with the TAG_FORCE_DECODE_MEMORY_MB environment variable.
+DEFAULT_MEMORY_LIMIT_MB = 512
+
+# Maximum per-channel difference (0-255) between the pipeline outputs from a
+# reduced decode and from a full decode. Photographic art stays within about
+# 4 levels; full-resolution noise is the worst case at 7.
+REDUCED_DECODE_MAX_PIXEL_DIFF = 8
+
+# ---------------------
+
+_memory_limit = int(float(os.environ.get("TAG_FORCE_DECODE_MEMORY_MB", DEFAULT_MEMORY_LIMIT_MB)) * 1024 * 1024)
+
+# Scales JPEG decoding can use with Image.draft
+JPEG_DRAFT_SCALES = (1, 2, 4, 8)
+
+
+def set_memory_limit(limit_mb):
+    """Sets the ceiling for the pixel data of one decoded source, in MB."""
+    global _memory_limit
+    _memory_limit = int(limit_mb * 1024 * 1024)
+
+
+def decoded_size_bytes(image, size=None, mode=None):
+    """
+    Estimates the memory a decoded image takes (width x height x bands),
+    at its own size or at the given (width, height). If mode is given, the
+    bands it will be converted to count too (a P image grows 4x as RGBA).
+    """
+    width, height = size or image.size
+    bands = len(image.getbands())
+    if mode is not None:
+        bands = max(bands, Image.getmodebands(mode))
+    return width * height * max(bands, 1)
+
+
+def choose_jpeg_scale(image, min_size, reduce=True, mode="RGBA"):
+    """
+    Picks the DCT scale (1, 2, 4 or 8) to decode a JPEG at: the largest one
+    that keeps at least min_size, then larger ones if the result would not
+    fit under the memory ceiling.
+
+    Returns:
+        int: The scale, e.g. 4 decodes at a quarter of the width and height.
+    """
+    def scaled(scale):
+        return (-(-image.width // scale), -(-image.height // scale))
+
+    scale = 1
+    if reduce:
+        for candidate in JPEG_DRAFT_SCALES:
+            width, height = scaled(candidate)
+            if width >= min_size[0] and height >= min_size[1]:
+                scale = candidate
+    for candidate in JPEG_DRAFT_SCALES:
+        if candidate >= scale and decoded_size_bytes(image, scaled(candidate), mode) <= _memory_limit:
+            return candidate
+    return JPEG_DRAFT_SCALES[-1]
+
+
+def open_for_size(image_path, target_size, mode="RGBA", reduce=True):
+    """
+    Opens and decodes an image for downscaling to target_size, decoding as
+    little of it as the format allows.
+
+    JPEGs are decoded directly at a reduced DCT scale (1/2, 1/4 or 1/8)
+    with Image.draft. Other formats are decoded fully and then shrunk by a
+    whole factor with Image.reduce. Either way the result stays at least
+    REDUCE_MARGIN times target_size.
+
+    No decode may go over the memory ceiling (set_memory_limit): a JPEG is
+    drafted at a smaller scale until it fits, with a warning if that drops
+    below REDUCE_MARGIN, and any other image too large to decode is refused
+    before any pixels are read.
+
+    Args:
+        image_path (str): The path to the source image.
+        target_size (tuple): The (width, height) the caller will resize to.
+        mode (str): The mode to convert the result to.
+        reduce (bool): False decodes at full size, as before.
+
+    Returns:
+        PIL.Image.Image: The decoded image, in the requested mode.
+
+    Raises:
+        FileNotFoundError: If the image does not exist.
+        MemoryError: If a non-JPEG image would go over the memory ceiling.
+    """
+    image = Image.open(image_path)
+    full_size = image.size
+    min_width = target_size[0] * REDUCE_MARGIN
+    min_height = target_size[1] * REDUCE_MARGIN
+
+    if image.format == "JPEG":
+        scale = choose_jpeg_scale(image, (min_width, min_height), reduce, mode)
+        if scale > 1:
+            # draft picks the largest scale with size // requested >= scale
+            image.draft(image.mode, (max(image.width // scale, 1), max(image.height // scale, 1)))
+
+    if decoded_size_bytes(image, mode=mode) > _memory_limit:
+        raise MemoryError(
+            f"Decoding {os.path.basename(image_path)} ({image.width}x{image.height}) needs "
+            f"{decoded_size_bytes(image, mode=mode) / (1024 * 1024):.1f} MB, over the "
+            f"{_memory_limit / (1024 * 1024):.1f} MB decode memory ceiling. Shrink the image "
+            "or raise --decode-memory-mb / TAG_FORCE_DECODE_MEMORY_MB.")
+    if image.width < min_width < full_size[0] or image.height < min_height < full_size[1]:
+        print(f"Warning: Decoding {os.path.basename(image_path)} at {image.width}x{image.height} to stay under "
+              f"the {_memory_limit / (1024 * 1024):.1f} MB decode memory ceiling; the art may lose detail.")
+
+    image.load()
+    # Converted first: Image.reduce does not support P, 1 or I;16 images
+    if image.mode != mode:
+        image = image.convert(mode)
+    if reduce:
+        factor = min(image.width // min_width, image.height // min_height)
+        if factor >= 2:
+            image = image.reduce(factor)
+
+    if image.size != full_size:
+        print(f"Decoded {os.path.basename(image_path)} at {image.width}x{image.height} "
+              f"instead of {full_size[0]}x{full_size[1]}.")
+    return image
+
+
+def check_reduced_decode(image_path, target_size=(312, 312)):
+    """
+    Renders the large and small overlays from a full decode and from a
+    reduced decode of the same source, and compares them.
+
+    Returns:
+        dict: {"full_size", "reduced_size", "full_seconds", "reduced_seconds",
+        "max_diff"}, where max_diff is the largest per-channel difference
+        between the two sets of outputs.
+    """
+    import time
+    from PIL import ImageChops
+    from tag_force_cropper import crop_to_layout
+    from tag_force_small_thumb_generator import render_small_thumbnail
+
+    results = {}
+    outputs = {}
+    for label, reduce in (("full", False), ("reduced", True)):
+        start = time.perf_counter()
+        source_image = open_for_size(image_path, target_size, reduce=reduce)
+        outputs[label] = (crop_to_layout(source_image), render_small_thumbnail(source_image))
+        results[f"{label}_seconds"] = time.perf_counter() - start
+        results[f"{label}_size"] = source_image.size
+
+    max_diff = 0
+    for full_output, reduced_output in zip(outputs["full"], outputs["reduced"]):
+        difference = ImageChops.difference(full_output.convert("RGBa"), reduced_output.convert("RGBa"))
+        max_diff = max(max_diff, max(high for _, high in difference.getextrema()))
+    results["max_diff"] = max_diff
+    return results
+
+
+def main(argv=None, prog=None):
+    """Runs the command line interface. argv defaults to sys.argv[1:]."""
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Compare reduced-size decoding with full decoding on source images.")
+    parser.add_argument("images", nargs="+", help="Source images to check.")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for image_path in args.images:
+        result = check_reduced_decode(image_path)
+        within = result["max_diff"] <= REDUCED_DECODE_MAX_PIXEL_DIFF
+        failed = failed or not within
+        print(f"{image_path}: full {result['full_size'][0]}x{result['full_size'][1]} "
+              f"{result['full_seconds'] * 1000:.0f} ms, reduced {result['reduced_size'][0]}x{result['reduced_size'][1]} "
+              f"{result['reduced_seconds'] * 1000:.0f} ms, max diff {result['max_diff']} "
+              f"({'ok' if within else 'over'} tolerance {REDUCED_DECODE_MAX_PIXEL_DIFF})")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
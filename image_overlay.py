@@ -1,33 +1,82 @@
 import sys
 import os
-import subprocess
 import shutil
-import csv
 from PIL import Image
+from game_profiles import get_profile, lookup_card_name, lookup_image_id, profile_path, source_decode_size
+from image_decoder import open_for_size
+from tag_force_cropper import crop_to_layout
+from tag_force_small_thumb_generator import render_small_thumbnail
+from tag_force_tiny_thumb_finder import locate_in_atlases
+
+def backup_file(source_path, backup_path):
+    """Copies a base texture into the backup folder before it is modified."""
+    if os.path.exists(source_path):
+        print(f"Backing up {source_path} to {backup_path}")
+        shutil.copyfile(source_path, backup_path)
+    else:
+        print(f"Warning: {source_path} not found, skipping backup.")
 
-def overlay_images(input_image_path, image_id):
+def flush_atlas_session(atlas_session):
     """
-    Processes an input image, overlays it onto a base image, and saves the result.
+    Saves the atlas held open by an atlas session, if any, and empties the session.
 
     Args:
-        input_image_path (str): The path to the source image.
-        image_id (str): The ID of the image, used to find the base image.
+        atlas_session (dict): {"path": output_atlas_path, "image": RGBA image}.
     """
-    # Define file paths
-    base_name, extension = os.path.splitext(input_image_path)
-    processed_image_path = f"{base_name}_processed.png"
-    small_overlay_path = f"{base_name}_small_overlay.png"
+    if atlas_session.get("image") is not None:
+        atlas_session["image"].save(atlas_session["path"])
+        print(f"Saved modified atlas to {atlas_session['path']}")
+    atlas_session["path"] = None
+    atlas_session["image"] = None
+
+def paste_title(base_image, title_image, layout):
+    """
+    Composites each title region of a typeset title strip over a large
+    texture, so the name plate around the lettering is kept. alpha_composite
+    is used rather than a masked paste, which would also blend the strip's
+    transparency into the texture's alpha at the glyph edges.
+    """
+    if title_image.size != layout["title_size"]:
+        title_image = title_image.resize(layout["title_size"], Image.Resampling.LANCZOS)
+    for crop_box, paste_position in layout["title_regions"]:
+        base_image.alpha_composite(title_image.crop(crop_box), paste_position)
 
-    base_image_path = os.path.join("large", f"{image_id}.png")
-    output_dir_large = os.path.join("output", "large")
+def overlay_source(source_image, image_id, profile, fused=False, atlas_slot=None, atlas_session=None,
+                   title_image=None):
+    """
+    Overlays an already decoded source image onto one game's large, small
+    and tiny textures, and saves the results under the profile's output folder.
+
+    Args:
+        source_image (PIL.Image.Image): The source art, in RGBA mode.
+        image_id (str): The ID of the image, used to find the base images.
+        profile (dict): The game profile (see game_profiles).
+        fused (bool): Render the small thumbnail with the fused mode (no intermediate canvas).
+        atlas_slot (dict): The card's atlas cell as returned by locate_in_atlases,
+            if already known. Skips the atlas search.
+        atlas_session (dict): If given, the modified atlas is kept open in this
+            session instead of being saved, so consecutive cards on the same
+            atlas load and save it once. Call flush_atlas_session when done.
+        title_image (PIL.Image.Image): A typeset title strip (see
+            card_name_typesetter.render_title) to write into the large texture.
+
+    Raises:
+        FileNotFoundError: If a base image or the tiny atlas folder is missing.
+        LookupError: If the card could not be found in any tiny atlas.
+    """
+    layout = profile["layout"]
+
+    # Define file paths
+    base_image_path = profile_path(profile, "large", f"{image_id}.png")
+    output_dir_large = profile_path(profile, "output", "large")
     output_path_large = os.path.join(output_dir_large, f"{image_id}.png")
-    backup_dir_large = os.path.join("backup", "large")
+    backup_dir_large = profile_path(profile, "backup", "large")
     backup_path_large = os.path.join(backup_dir_large, f"{image_id}.png")
 
-    small_base_image_path = os.path.join("small", f"{image_id}.png")
-    output_dir_small = os.path.join("output", "small")
+    small_base_image_path = profile_path(profile, "small", f"{image_id}.png")
+    output_dir_small = profile_path(profile, "output", "small")
     output_path_small = os.path.join(output_dir_small, f"{image_id}.png")
-    backup_dir_small = os.path.join("backup", "small")
+    backup_dir_small = profile_path(profile, "backup", "small")
     backup_path_small = os.path.join(backup_dir_small, f"{image_id}.png")
 
     # Ensure the output and backup directories exist
@@ -36,207 +85,263 @@ def overlay_images(input_image_path, image_id):
     os.makedirs(output_dir_small, exist_ok=True)
     os.makedirs(backup_dir_small, exist_ok=True)
 
-    # Backup the original large file
-    if os.path.exists(base_image_path):
-        print(f"Backing up {base_image_path} to {backup_path_large}")
-        shutil.copyfile(base_image_path, backup_path_large)
-    else:
-        print(f"Warning: {base_image_path} not found, skipping backup.")
+    # Backup the original large and small files
+    backup_file(base_image_path, backup_path_large)
+    backup_file(small_base_image_path, backup_path_small)
 
-    # Backup the original small file
-    if os.path.exists(small_base_image_path):
-        print(f"Backing up {small_base_image_path} to {backup_path_small}")
-        shutil.copyfile(small_base_image_path, backup_path_small)
-    else:
-        print(f"Warning: {small_base_image_path} not found, skipping backup.")
+    # --- Large Image Processing ---
 
-    # Step 1: Invoke tag_force_cropper.py
-    print(f"Running tag_force_cropper.py on {input_image_path}...")
-    try:
-        subprocess.run(["python", "tag_force_cropper.py", input_image_path], check=True)
-        print(f"Successfully created {processed_image_path}")
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        print(f"Error running tag_force_cropper.py: {e}")
-        sys.exit(1)
+    # Step 1: Crop the source into the large layout, reduced to PNG8 like the game's textures
+    overlay_image = crop_to_layout(source_image, layout)
+    overlay_image = overlay_image.quantize(colors=256, dither=Image.Dither.FLOYDSTEINBERG).convert("RGBA")
 
-    # Step 2: Load the large images
-    try:
-        base_image = Image.open(base_image_path).convert("RGBA")
-        overlay_image = Image.open(processed_image_path).convert("RGBA")
-        print("Large images loaded successfully.")
-    except FileNotFoundError as e:
-        print(f"Error loading large images: {e}")
-        sys.exit(1)
+    # Step 2: Load the large base image
+    base_image = Image.open(base_image_path).convert("RGBA")
 
     # Step 3: Overlay the large images
     base_image.paste(overlay_image, (0, 0), overlay_image)
     print("Large image overlay complete.")
 
+    # Step 3b: Write the card name while the large texture is still decoded
+    if title_image is not None:
+        paste_title(base_image, title_image, layout)
+        print("Title overlay complete.")
+
     # Step 4: Save the large result
     base_image.save(output_path_large)
     print(f"Output image saved to {output_path_large}")
 
-    # Step 5: Remove the intermediate large processed image
-    try:
-        os.remove(processed_image_path)
-        print(f"Removed intermediate file: {processed_image_path}")
-    except OSError as e:
-        print(f"Error removing intermediate file: {e}")
+    # --- Small Image Processing ---
 
-    # --- small Image Processing ---
+    # Step 5: Render the small overlay
+    small_overlay_image = render_small_thumbnail(source_image, fused, layout)
 
-    # Step 6: Invoke tag_force_small_thumb_generator.py
-    print(f"Running tag_force_small_thumb_generator.py on {input_image_path}...")
-    try:
-        subprocess.run(["python", "tag_force_small_thumb_generator.py", input_image_path], check=True)
-        print(f"Successfully created {small_overlay_path}")
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        print(f"Error running tag_force_small_thumb_generator.py: {e}")
-        sys.exit(1)
-
-    # Step 7: Load the small images
-    try:
-        small_base_image = Image.open(small_base_image_path).convert("RGBA")
-        small_overlay_image = Image.open(small_overlay_path).convert("RGBA")
-        print("small images loaded successfully.")
-    except FileNotFoundError as e:
-        print(f"Error loading small images: {e}")
-        sys.exit(1)
+    # Step 6: Load the small base image, keeping the original for the atlas search
+    original_small_image = Image.open(small_base_image_path).convert("RGBA")
+    small_base_image = original_small_image.copy()
 
-    # Step 8: Overlay the small images
+    # Step 7: Overlay the small images
     small_base_image.paste(small_overlay_image, (0, 0), small_overlay_image)
     print("small image overlay complete.")
 
-    # Step 9: Save the small result
+    # Step 8: Save the small result
     small_base_image.save(output_path_small)
     print(f"Output small image saved to {output_path_small}")
 
-    # Step 10: Remove the intermediate small processed image
-    try:
-        os.remove(small_overlay_path)
-        print(f"Removed intermediate file: {small_overlay_path}")
-    except OSError as e:
-        print(f"Error removing intermediate file: {e}")
-
     # --- Tiny Atlas Processing ---
 
-    # Step 11: Find the small image in the tiny atlas
-    print(f"Finding '{image_id}' in tiny atlases...")
-    try:
-        result = subprocess.run(
-            ["python", "tag_force_tiny_thumb_finder.py", image_id],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        
-        # Parse the output from the finder script
-        lines = result.stdout.strip().split('\n')
-        atlas_file = None
-        pixel_x, pixel_y = -1, -1
-
-        for line in lines:
-            if "Atlas File:" in line:
-                atlas_file = line.split("Atlas File:")[1].strip()
-            elif "Best Match Pixel X:" in line:
-                pixel_x = int(line.split("Best Match Pixel X:")[1].strip())
-            elif "Best Match Pixel Y:" in line:
-                pixel_y = int(line.split("Best Match Pixel Y:")[1].strip())
-
-        if not atlas_file or pixel_x == -1 or pixel_y == -1:
-            print("Error: Could not parse output from tag_force_tiny_thumb_finder.py")
-            sys.exit(1)
-            
-        print(f"Found match in '{atlas_file}' at coordinates ({pixel_x}, {pixel_y})")
-
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        print(f"Error running tag_force_tiny_thumb_finder.py: {e}")
-        if hasattr(e, 'stderr'):
-            print(e.stderr)
-        sys.exit(1)
+    # Step 9: Find the original small image in the tiny atlases
+    tiny_dir = profile_path(profile, "tiny")
+    best_match = atlas_slot
+    if best_match is None:
+        print(f"Finding '{image_id}' in tiny atlases...")
+        best_match = locate_in_atlases(original_small_image, tiny_dir, layout)
+    if not best_match:
+        raise LookupError(f"Could not find '{image_id}' in any atlas in '{tiny_dir}/'.")
+
+    atlas_file = best_match["file"]
+    pixel_x, pixel_y = best_match["pixel_x"], best_match["pixel_y"]
+    print(f"Found match in '{atlas_file}' at coordinates ({pixel_x}, {pixel_y})")
+
+    # Step 10: Backup, overlay, and save the tiny atlas
+    atlas_path = os.path.join(tiny_dir, atlas_file)
+    backup_atlas_path = profile_path(profile, "backup", "tiny", atlas_file)
+    output_atlas_path = profile_path(profile, "output", "tiny", atlas_file)
+
+    # Ensure directories exist
+    os.makedirs(profile_path(profile, "backup", "tiny"), exist_ok=True)
+    os.makedirs(profile_path(profile, "output", "tiny"), exist_ok=True)
+
+    # Backup the original atlas if it doesn't exist
+    if not os.path.exists(backup_atlas_path):
+        print(f"Backing up {atlas_path} to {backup_atlas_path}")
+        shutil.copyfile(atlas_path, backup_atlas_path)
+    else:
+        print(f"Backup for {atlas_file} already exists, skipping backup.")
+
+    # Resize the modified small image for the atlas
+    atlas_overlay = small_base_image.resize(layout["atlas_cell_size"], Image.Resampling.LANCZOS)
+
+    # Keep working on the atlas the session already holds open
+    if atlas_session is not None and atlas_session.get("path") == output_atlas_path:
+        atlas_session["image"].paste(atlas_overlay, (pixel_x, pixel_y), atlas_overlay)
+        print(f"Updated open atlas {output_atlas_path}")
+        return
+
+    # Load the atlas for modification
+    # If an output atlas already exists, use it; otherwise, use the original.
+    if atlas_session is not None:
+        flush_atlas_session(atlas_session)
+    if os.path.exists(output_atlas_path):
+        print(f"Found existing output atlas. Loading {output_atlas_path} for modification.")
+        atlas_base_image = Image.open(output_atlas_path).convert("RGBA")
+    else:
+        print(f"No existing output atlas found. Loading {atlas_path} for modification.")
+        atlas_base_image = Image.open(atlas_path).convert("RGBA")
 
-    # Step 12: Backup, overlay, and save the tiny atlas
-    try:
-        # Define atlas paths
-        atlas_path = os.path.join("tiny", atlas_file)
-        backup_atlas_path = os.path.join("backup", "tiny", atlas_file)
-        output_atlas_path = os.path.join("output", "tiny", atlas_file)
-
-        # Ensure directories exist
-        os.makedirs(os.path.join("backup", "tiny"), exist_ok=True)
-        os.makedirs(os.path.join("output", "tiny"), exist_ok=True)
-
-        # Backup the original atlas if it doesn't exist
-        if not os.path.exists(backup_atlas_path):
-            print(f"Backing up {atlas_path} to {backup_atlas_path}")
-            shutil.copyfile(atlas_path, backup_atlas_path)
-        else:
-            print(f"Backup for {atlas_file} already exists, skipping backup.")
-
-        # Load the modified small image and resize it for the atlas
-        modified_small_image = Image.open(output_path_small).convert("RGBA")
-        atlas_overlay = modified_small_image.resize((88, 120), Image.Resampling.LANCZOS)
-
-        # Load the atlas for modification
-        # If an output atlas already exists, use it; otherwise, use the original.
-        if os.path.exists(output_atlas_path):
-            print(f"Found existing output atlas. Loading {output_atlas_path} for modification.")
-            atlas_base_image = Image.open(output_atlas_path).convert("RGBA")
-        else:
-            print(f"No existing output atlas found. Loading {atlas_path} for modification.")
-            atlas_base_image = Image.open(atlas_path).convert("RGBA")
-
-        # Paste the overlay
-        atlas_base_image.paste(atlas_overlay, (pixel_x, pixel_y), atlas_overlay)
-        
-        # Save the modified atlas
-        atlas_base_image.save(output_atlas_path)
-        print(f"Saved modified atlas to {output_atlas_path}")
-
-    except FileNotFoundError as e:
-        print(f"Error processing atlas file: {e}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"An unexpected error occurred during atlas processing: {e}")
-        sys.exit(1)
+    # Paste the overlay
+    atlas_base_image.paste(atlas_overlay, (pixel_x, pixel_y), atlas_overlay)
 
+    # Save the modified atlas, or keep it open for the next card in the session
+    if atlas_session is not None:
+        atlas_session["path"] = output_atlas_path
+        atlas_session["image"] = atlas_base_image
+        return
+    atlas_base_image.save(output_atlas_path)
+    print(f"Saved modified atlas to {output_atlas_path}")
 
-if __name__ == "__main__":
-    if len(sys.argv) not in [2, 3]:
-        print("Usage: python image_overlay.py <input_image> [image_id]")
-        print("Example: python image_overlay.py image_source.png 4007")
-        print("Example: python image_overlay.py \"Exiled Force.png\"")
+def render_card_title(card_name, title_style):
+    """
+    Typesets a card name with the given title style, or returns None if
+    titles are disabled.
+
+    Args:
+        card_name (str): The card name as it appears in the catalog.
+        title_style (dict): {"font": font_path, "color": color, "plate": color},
+            or None. If "plate" is set, the strip is filled with that opaque
+            color first, hiding the game's original name.
+    """
+    if title_style is None:
+        return None
+    from card_name_typesetter import render_title
+    title_image = render_title(card_name, title_style["font"], title_style["color"])
+    if title_style.get("plate"):
+        plate = Image.new("RGBA", title_image.size, title_style["plate"])
+        plate.alpha_composite(title_image)
+        title_image = plate
+    return title_image
+
+def overlay_for_profiles(input_image_path, profiles, image_id=None, fused=False, title_style=None):
+    """
+    Decodes a source image once and writes its overlays for every given game profile.
+
+    Args:
+        input_image_path (str): The path to the source image.
+        profiles (list): The game profiles to render (see game_profiles).
+        image_id (str): The image ID to use. If None, the ID is looked up by
+            card name (the file name without extension) in each profile's catalog.
+        fused (bool): Render the small thumbnail with the fused mode (no intermediate canvas).
+        title_style (dict): If given (see render_card_title), the catalog's
+            card name is typeset and written into every profile's large
+            texture. With an explicit image_id, the name is looked up by ID.
+
+    Returns:
+        list: The names of the profiles that were written.
+
+    Raises:
+        FileNotFoundError: If the source image or a needed catalog is missing.
+        LookupError: If titles are requested for an image ID that is not in
+            a profile's catalog.
+    """
+    card_name = os.path.splitext(os.path.basename(input_image_path))[0]
+
+    # {profile_name: title strip}, resolved before anything is written
+    title_images = {}
+    if title_style is not None and image_id is not None:
+        for profile in profiles:
+            title_name = lookup_card_name(profile, image_id)
+            if not title_name:
+                raise LookupError(f"Image ID {image_id} is not in {profile['catalog']}, "
+                                  "so there is no card name to typeset. Omit --titles or the image ID.")
+            title_images[profile["name"]] = render_card_title(title_name, title_style)
+    elif title_style is not None:
+        # The file name is the catalog name; profiles without it are skipped below
+        title_image = render_card_title(card_name, title_style)
+        title_images = {profile["name"]: title_image for profile in profiles}
+
+    source_image = open_for_size(input_image_path, source_decode_size(profiles))
+
+    written = []
+    for profile in profiles:
+        profile_image_id = image_id
+        if profile_image_id is None:
+            profile_image_id = lookup_image_id(profile, card_name)
+            if not profile_image_id:
+                print(f"Warning: '{card_name}' not found in {profile['catalog']}, skipping {profile['name']}.")
+                continue
+            print(f"Found image ID {profile_image_id} for '{card_name}' in {profile['catalog']}")
+
+        print(f"--- {profile['name']}: overlaying onto image {profile_image_id} ---")
+        overlay_source(source_image, profile_image_id, profile, fused, title_image=title_images.get(profile["name"]))
+        written.append(profile["name"])
+
+    return written
+
+def overlay_images(input_image_path, image_id, profile=None, fused=False, title_style=None):
+    """
+    Processes an input image, overlays it onto a base image, and saves the result.
+
+    Args:
+        input_image_path (str): The path to the source image.
+        image_id (str): The ID of the image, used to find the base image.
+        profile (dict): The game profile. Defaults to the working directory layout.
+        fused (bool): Render the small thumbnail with the fused mode (no intermediate canvas).
+        title_style (dict): If given (see render_card_title), also write the card name.
+    """
+    overlay_for_profiles(input_image_path, [profile or get_profile(None)], image_id, fused, title_style)
+
+
+def add_title_arguments(parser):
+    """Adds the --titles, --title-font, --title-color and --title-plate options to a parser."""
+    from card_name_typesetter import DEFAULT_FONT
+
+    parser.add_argument("--titles", action="store_true",
+                        help="Also typeset the card name into the large texture.")
+    parser.add_argument("--title-font", type=str, default=DEFAULT_FONT,
+                        help="TTF font for --titles.")
+    parser.add_argument("--title-color", type=str, default="black",
+                        help="Text color for --titles (e.g. 'black', '#FFFFFF').")
+    parser.add_argument("--title-plate", type=str, default=None,
+                        help="Fill the title regions with this opaque color before writing the name, "
+                             "to hide the original name (default: keep the name plate).")
+
+def title_style_from_args(args):
+    """Returns the title style selected by add_title_arguments options, or None."""
+    if not args.titles:
+        return None
+    return {"font": args.title_font, "color": args.title_color, "plate": args.title_plate}
+
+def main(argv=None, prog=None):
+    """Runs the command line interface. argv defaults to sys.argv[1:]."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Overlay a card image onto the game's large, small and tiny textures.",
+        epilog="Examples: python image_overlay.py image_source.png 4007 | "
+               "python image_overlay.py \"Exiled Force.png\" --profile TF5 --profile TFSP")
+    parser.add_argument("input_image", type=str, help="The source image.")
+    parser.add_argument("image_id", type=str, nargs="?", default=None,
+                        help="The image ID. If omitted, it is looked up by card name in the catalog.")
+    parser.add_argument("--profile", action="append", dest="profiles", default=None,
+                        help="Game profile to render (repeatable): TF1, TF5 or TFSP. "
+                             "Default: cards.csv and the folders in the working directory.")
+    parser.add_argument("--fused", action="store_true",
+                        help="Render the small thumbnail without the 400x583 card canvas and its full-canvas resize.")
+    add_title_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    try:
+        profiles = [get_profile(name) for name in (args.profiles or [None])]
+    except KeyError as e:
+        print(f"Error: {e.args[0]}")
         sys.exit(1)
 
-    input_image = sys.argv[1]
-    image_id = None
+    if args.image_id and len(profiles) > 1:
+        print("Error: Image IDs differ between games. Omit image_id when rendering several profiles.")
+        sys.exit(1)
 
-    if len(sys.argv) == 3:
-        image_id = sys.argv[2]
-    else:
-        # Get the filename from the path, then remove the extension
-        image_name_without_ext = os.path.splitext(os.path.basename(input_image))[0]
-        try:
-            with open('cards.csv', mode='r', newline='', encoding='utf-8') as csvfile:
-                reader = csv.reader(csvfile)
-                for row in reader:
-                    if row and row[0] == image_name_without_ext:
-                        image_id = row[1]
-                        print(f"Found image ID {image_id} for '{image_name_without_ext}' in cards.csv")
-                        break
-        except FileNotFoundError:
-            print("Error: cards.csv not found. Please provide an image_id.")
-            sys.exit(1)
-        
-        if not image_id:
-            print(f"Error: Image ID for '{image_name_without_ext}' not found in cards.csv. Please specify the ID manually.")
-            sys.exit(1)
-
-    # Check if the Pillow library is installed
     try:
-        from PIL import Image
-    except ImportError:
-        print("Pillow library not found. Please install it using: pip install Pillow")
+        written = overlay_for_profiles(args.input_image, profiles, args.image_id, args.fused,
+                                       title_style_from_args(args))
+    except (FileNotFoundError, LookupError, MemoryError) as e:
+        print(f"Error: {e}")
         sys.exit(1)
 
-    overlay_images(input_image, image_id)
+    if not written:
+        print("Error: Image ID not found in any catalog. Please specify the ID manually.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
-import imagehash
+import hashlib
+import json
+import math
 import os
 import pickle
+import sys
 import time
+import zlib
 from PIL import Image
+from dir_scanner import iter_files
 
 # --- Configuration ---
 # 1. Path to your texture dump with PPSSPP hashes (Set A)
@@ -17,21 +22,33 @@ cache_filename = "hash_database.cache"
 # 4. Path where you want the final textures.ini to be saved
 output_ini_file = r"D:\tiny\output2"
 
+# 5. Number of leading characters of the PPSSPP hash used to assign Set A files
+#    to shards. 0 uses the whole name. PPSSPP names start with the texture
+#    address, which is aligned (and zeroed with ignoreAddress), so a short
+#    prefix puts almost every file in the same shard.
+shard_prefix_length = 0
+
+# 6. How far the largest shard may exceed the average before the balance
+#    check fails, as a fraction of the average (see check_shard_balance).
+shard_balance_tolerance = 0.25
+
 # ---------------------
 
 
-def build_hash_database(folder_path, cache_file_name):
+def build_hash_database(folder_path, cache_file_name, use_cache=True):
     """
     Scans the set of correctly named textures and creates a database
     of {image_hash: "clean_filename.png"}.
     --- Uses a cache file if available. ---
+    With use_cache=False the database is always rebuilt from the images,
+    and the file is written as a required artifact: a failed save raises.
     """
     print(f"--- Phase 1: Building/Loading hash database from {folder_path} ---")
     
     cache_file_path = os.path.join(folder_path, cache_file_name)
     
     # --- Caching Logic ---
-    if os.path.exists(cache_file_path):
+    if use_cache and os.path.exists(cache_file_path):
         try:
             print(f"  Found cache file! Loading from {cache_file_path}...")
             with open(cache_file_path, 'rb') as f:
@@ -42,90 +59,185 @@ def build_hash_database(folder_path, cache_file_name):
             print(f"  Warning: Could not load cache file. Rebuilding. Error: {e}")
 
     # --- If cache not found or failed, build it ---
-    print("  No valid cache found. Building database from images...")
+    if use_cache:
+        print("  No valid cache found. Building database from images...")
+    else:
+        print("  Building database from images...")
+    import imagehash  # Deferred: pulls in SciPy and PyWavelets
     database = {}
     count = 0
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".png"):
-            try:
-                img_path = os.path.join(folder_path, filename)
-                
-                with Image.open(img_path) as img:
-                    img_hash = imagehash.dhash(img)
-                
-                database[img_hash] = filename
-                count += 1
-                if count % 500 == 0:
-                    print(f"  ...indexed {count} images.")
-            except Exception as e:
-                print(f"  Warning: Could not process {filename}. Error: {e}")
+    # Set B is not scanned recursively: the Set A dump usually lives inside it.
+    for img_path in iter_files(folder_path, extensions=(".png",), recursive=False):
+        filename = os.path.basename(img_path)
+        try:
+            with Image.open(img_path) as img:
+                img_hash = imagehash.dhash(img)
+            
+            database[img_hash] = filename
+            count += 1
+            if count % 500 == 0:
+                print(f"  ...indexed {count} images.")
+        except Exception as e:
+            print(f"  Warning: Could not process {filename}. Error: {e}")
     
     # --- Save to cache ---
+    # Written to a temporary file first, so readers never see a half-written database
+    partial_path = f"{cache_file_path}.partial"
     try:
         print(f"  Saving database to cache file: {cache_file_path}")
-        with open(cache_file_path, 'wb') as f:
+        with open(partial_path, 'wb') as f:
             pickle.dump(database, f)
+        os.replace(partial_path, cache_file_path)
     except Exception as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        if not use_cache:
+            raise
         print(f"  Warning: Could not save cache file. Error: {e}")
 
     print(f"--- Database build complete. Indexed {count} images. ---")
     return database
 
 
-def match_and_generate_ini(set_a_path, set_b_path, database, output_path):
+def file_digest(file_path, chunk_size=1 << 20):
     """
-    Scans Set A (English dump), compares with the database,
-    and writes the textures.ini file.
+    Returns a fast content digest of a file's raw bytes.
+    Byte-identical files always share a digest, so it can be used to
+    skip decoding duplicates in a texture dump.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_closest_match(hash_a, database):
+    """
+    Returns (best_match_filename, min_distance) for the database entry
+    closest to hash_a.
+    """
+    best_match_filename = None
+    min_distance = float('inf')
+
+    for hash_c, filename_c in database.items():
+        distance = hash_a - hash_c
+        if distance < min_distance:
+            min_distance = distance
+            best_match_filename = filename_c
+        # If we find a perfect match, we can stop searching for this image
+        if min_distance == 0:
+            break
+
+    return best_match_filename, min_distance
+
+
+def shard_for_hash(ppsspp_hash, shard_count, prefix_length=shard_prefix_length):
+    """
+    Returns the shard (0 to shard_count - 1) a PPSSPP hash belongs to.
+    The key (the first prefix_length characters, or the whole name for 0)
+    goes through a stable checksum before the modulo, so aligned or zeroed
+    fields cannot pile up in one shard, and every machine assigns a file
+    to the same shard without any coordination.
+    """
+    key = ppsspp_hash[:prefix_length] if prefix_length else ppsspp_hash
+    return zlib.crc32(key.lower().encode("utf-8")) % shard_count
+
+
+def check_shard_balance(ppsspp_hashes, shard_count, prefix_length=shard_prefix_length,
+                        tolerance=shard_balance_tolerance):
+    """
+    Counts how many of the given hashes each shard would match.
+
+    The largest shard may exceed the average by tolerance times the average,
+    or by four standard deviations of an even random split, whichever is
+    larger (small dumps are noisy).
+
+    Returns:
+        tuple: (counts, balanced), where counts is a list of files per shard.
+    """
+    counts = [0] * shard_count
+    for ppsspp_hash in ppsspp_hashes:
+        counts[shard_for_hash(ppsspp_hash, shard_count, prefix_length)] += 1
+
+    average = sum(counts) / shard_count
+    limit = average + max(tolerance * average, 4 * math.sqrt(average))
+    return counts, max(counts) <= limit
+
+
+def match_set_a(set_a_path, set_b_path, database, temp_dir=None,
+                shard_index=0, shard_count=1, prefix_length=shard_prefix_length):
+    """
+    Scans Set A (English dump) and compares it with the database.
     Finds the absolute closest match instead of using a threshold.
+
+    Args:
+        set_a_path (str): The PPSSPP texture dump.
+        set_b_path (str): The correctly named textures, used for the
+            verification images.
+        database (dict): {image_hash: "clean_filename.png"} for Set B.
+        temp_dir (str): Where to save verification images. None skips them.
+        shard_index (int): Only match the files of this shard...
+        shard_count (int): ...out of this many (see shard_for_hash).
+        prefix_length (int): Hash prefix length used to assign shards
+            (0 for the whole name).
+
+    Returns:
+        set: The textures.ini lines ("ppsspp_hash = clean_filename.png").
     """
     print(f"--- Phase 2: Matching hashes from {set_a_path} ---")
+    if shard_count > 1:
+        print(f"  Shard {shard_index} of {shard_count} (hash prefix length {prefix_length or 'all'})")
+    import imagehash  # Deferred: pulls in SciPy and PyWavelets
+
+    if temp_dir is not None:
+        os.makedirs(temp_dir, exist_ok=True)
 
-    # --- Create a temp directory for comparison images ---
-    output_dir = os.path.dirname(output_path)
-    temp_dir = os.path.join(output_dir, "temp")
-    os.makedirs(temp_dir, exist_ok=True)
-    # ---------------------------------------------------------
-    
     ini_entries = set()
     total_files = 0
     matches_found = 0
-    
-    for filename_a in os.listdir(set_a_path):
-        if not filename_a.endswith(".png"):
+    # Byte-identical dumps are decoded and matched once.
+    # {content_digest: (best_match_filename, min_distance)}
+    digest_results = {}
+    duplicates_skipped = 0
+    bytes_skipped = 0
+
+    # Files are matched as the scan finds them, including sharded subfolders.
+    for img_a_path in iter_files(set_a_path, extensions=(".png",)):
+        filename_a = os.path.basename(img_a_path)
+        # Get the PPSSPP hash (the original filename without .png)
+        ppsspp_hash = os.path.splitext(filename_a)[0]
+        if shard_count > 1 and shard_for_hash(ppsspp_hash, shard_count, prefix_length) != shard_index:
             continue
-            
+
         total_files += 1
         try:
-            img_a_path = os.path.join(set_a_path, filename_a)
-            
-            with Image.open(img_a_path) as img:
-                hash_a = imagehash.dhash(img)
-            
-            # Find the closest match in the database
-            best_match_filename = None
-            min_distance = float('inf')
-
-            for hash_c, filename_c in database.items():
-                distance = hash_a - hash_c
-                if distance < min_distance:
-                    min_distance = distance
-                    best_match_filename = filename_c
-                # If we find a perfect match, we can stop searching for this image
-                if min_distance == 0:
-                    break
-            # ----------------------------------------------------
+            digest = file_digest(img_a_path)
+            if digest in digest_results:
+                # Same bytes as an earlier file: reuse its match, no decode
+                # and no extra verification image.
+                best_match_filename, min_distance = digest_results[digest]
+                duplicates_skipped += 1
+                bytes_skipped += os.path.getsize(img_a_path)
+                is_representative = False
+            else:
+                with Image.open(img_a_path) as img:
+                    hash_a = imagehash.dhash(img)
+
+                # Find the closest match in the database
+                best_match_filename, min_distance = find_closest_match(hash_a, database)
+                digest_results[digest] = (best_match_filename, min_distance)
+                is_representative = True
 
             # If we found a match...
             if best_match_filename:
-                # Get the PPSSPP hash (the original filename without .png)
-                ppsspp_hash = os.path.splitext(filename_a)[0]
-                
                 # This is the line for the .ini file
                 ini_line = f"{ppsspp_hash} = {best_match_filename}"
                 ini_entries.add(ini_line)
                 matches_found += 1
 
-                # --- Create and save the combined image for verification ---
+            # --- Create and save the combined image for verification ---
+            if best_match_filename and is_representative and temp_dir is not None:
                 try:
                     img_c_path = os.path.join(set_b_path, best_match_filename)
                     with Image.open(img_a_path) as img_a, Image.open(img_c_path) as img_c:
@@ -148,7 +260,7 @@ def match_and_generate_ini(set_a_path, set_b_path, database, output_path):
 
                 except Exception as e:
                     print(f"  Warning: Could not create combined image for {filename_a}. Error: {e}")
-                # --------------------------------------------------------------------
+            # --------------------------------------------------------------------
 
             if total_files % 500 == 0:
                 print(f"  ...scanned {total_files} files. Found {matches_found} matches.")
@@ -158,9 +270,17 @@ def match_and_generate_ini(set_a_path, set_b_path, database, output_path):
 
     print(f"--- Matching complete. ---")
     print(f"  Total files in Set A scanned: {total_files}")
+    print(f"  Unique images decoded:        {len(digest_results)}")
+    print(f"  Duplicate decodes skipped:    {duplicates_skipped} ({bytes_skipped / (1024 * 1024):.1f} MB)")
     print(f"  Total unique matches found:   {len(ini_entries)}")
+    return ini_entries
+
 
-    # Write the final textures.ini file
+def write_ini(ini_entries, output_path):
+    """
+    Writes the textures.ini file, with its entries sorted so the same
+    matches always produce the same file.
+    """
     try:
         with open(output_path, "w") as f:
             f.write("[hashes]\n")
@@ -174,22 +294,191 @@ def match_and_generate_ini(set_a_path, set_b_path, database, output_path):
         print(f"Could not write to {output_path}. Error: {e}")
 
 
-# --- Run the script ---
-start_time = time.time()
-try:
-    # Phase 1 - Pass crop_box and cache_filename
-    hash_db = build_hash_database(set_b_folder, cache_filename)
-    
-    # Phase 2 - Pass crop_box
-    if hash_db:
-        match_and_generate_ini(set_a_folder, set_b_folder, hash_db, output_ini_file)
-    else:
-        print("Error: Hash database is empty. Check Set B folder path.")
+def match_and_generate_ini(set_a_path, set_b_path, database, output_path):
+    """
+    Scans Set A (English dump), compares with the database,
+    and writes the textures.ini file.
+    Verification images are saved to a temp folder next to it.
+    """
+    temp_dir = os.path.join(os.path.dirname(output_path), "temp")
+    ini_entries = match_set_a(set_a_path, set_b_path, database, temp_dir)
+    write_ini(ini_entries, output_path)
 
-except FileNotFoundError as e:
-    print(f"\n*** FATAL ERROR ***")
-    print(f"Could not find folder: {e.filename}")
-    print("Please check your folder paths in the configuration.")
-    
-end_time = time.time()
-print(f"Total time taken: {end_time - start_time:.2f} seconds.")
+
+# --- Sharded matching ---
+# Each shard matches its part of Set A against the same read-only hash
+# database and writes a partial result; merge_shard_results combines them
+# into the textures.ini a single-node run would have produced.
+
+def load_hash_database(db_path):
+    """
+    Loads a hash database built with build_hash_database, without ever
+    rebuilding or writing it, so it can be shared between shards.
+
+    Raises:
+        FileNotFoundError: If db_path does not exist.
+    """
+    with open(db_path, 'rb') as f:
+        database = pickle.load(f)
+    print(f"--- Loaded read-only hash database {db_path} ({len(database)} images). ---")
+    return database
+
+
+def write_shard_result(ini_entries, result_path, shard_index, shard_count, prefix_length, database_digest):
+    """
+    Writes one shard's matches as a partial result file (JSON).
+    """
+    result = {
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+        "prefix_length": prefix_length,
+        "database_digest": database_digest,
+        "entries": sorted(ini_entries),
+    }
+    partial_path = f"{result_path}.partial"
+    with open(partial_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=1)
+    os.replace(partial_path, result_path)
+    print(f"Wrote shard {shard_index}/{shard_count} result to {result_path} ({len(ini_entries)} entries).")
+
+
+def merge_shard_results(result_paths, output_path):
+    """
+    Merges shard result files into textures.ini.
+
+    Raises:
+        ValueError: If the results come from different shard layouts or
+            hash databases, or a shard is missing or duplicated.
+    """
+    results = []
+    for result_path in result_paths:
+        with open(result_path, "r", encoding="utf-8") as f:
+            results.append(json.load(f))
+
+    if not results:
+        raise ValueError("No shard results to merge.")
+
+    layout = {(r["shard_count"], r["prefix_length"], r["database_digest"]) for r in results}
+    if len(layout) != 1:
+        raise ValueError("Shard results were produced with different shard counts, prefix lengths or hash databases.")
+
+    shard_count = results[0]["shard_count"]
+    indices = sorted(r["shard_index"] for r in results)
+    if indices != list(range(shard_count)):
+        missing = sorted(set(range(shard_count)) - set(indices))
+        duplicated = sorted({i for i in indices if indices.count(i) > 1})
+        raise ValueError(f"Expected shards 0-{shard_count - 1} exactly once. Missing: {missing}, duplicated: {duplicated}")
+
+    ini_entries = set()
+    for r in results:
+        ini_entries.update(r["entries"])
+
+    print(f"--- Merged {shard_count} shards: {len(ini_entries)} entries. ---")
+    write_ini(ini_entries, output_path)
+
+
+def main(argv=None, prog=None):
+    """Runs the command line interface. argv defaults to sys.argv[1:]."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Match a PPSSPP texture dump (Set A) against correctly named textures (Set B) "
+                    "and write textures.ini. Without a command, runs on a single node with the "
+                    "folders from the configuration at the top of phash_matcher.py.")
+    parser.add_argument("--set-a", default=set_a_folder, help="The PPSSPP texture dump (Set A).")
+    parser.add_argument("--set-b", default=set_b_folder, help="The correctly named textures (Set B).")
+    parser.add_argument("--cache", default=cache_filename,
+                        help="Hash database cache file, relative to Set B unless absolute.")
+    parser.add_argument("-o", "--output", default=output_ini_file, help="Where to write textures.ini.")
+    commands = parser.add_subparsers(dest="command")
+
+    build_parser = commands.add_parser("build-db", help="Build the Set B hash database once, to share with the shards.")
+    build_parser.add_argument("db", help="Path of the hash database file to write.")
+
+    shard_parser = commands.add_parser("shard", help="Match one shard of Set A and write a partial result.")
+    shard_parser.add_argument("--db", required=True, help="The hash database from build-db (read-only).")
+    shard_parser.add_argument("--index", type=int, required=True, help="This shard's index (0-based).")
+    shard_parser.add_argument("--count", type=int, required=True, help="The total number of shards.")
+    shard_parser.add_argument("--result", required=True, help="Path of the partial result file to write.")
+    shard_parser.add_argument("--prefix-length", type=int, default=shard_prefix_length,
+                              help=f"Hash prefix length used to assign shards, 0 for the whole name "
+                                   f"(default: {shard_prefix_length}).")
+    shard_parser.add_argument("--verify-dir", default=None,
+                              help="Save verification images here (needs --set-b). Off by default.")
+
+    balance_parser = commands.add_parser("balance", help="Check how evenly Set A splits into shards.")
+    balance_parser.add_argument("--count", type=int, required=True, help="The number of shards.")
+    balance_parser.add_argument("--prefix-length", type=int, default=shard_prefix_length,
+                                help=f"Hash prefix length used to assign shards, 0 for the whole name "
+                                     f"(default: {shard_prefix_length}).")
+
+    merge_parser = commands.add_parser("merge", help="Merge shard results into textures.ini.")
+    merge_parser.add_argument("results", nargs="+", help="The partial result files of every shard.")
+
+    args = parser.parse_args(argv)
+
+    start_time = time.time()
+    try:
+        if args.command == "build-db":
+            database = build_hash_database(args.set_b, os.path.abspath(args.db), use_cache=False)
+            if not database:
+                print("Error: Hash database is empty. Check Set B folder path.")
+                sys.exit(1)
+
+        elif args.command == "shard":
+            if not 0 <= args.index < args.count:
+                print(f"Error: --index must be between 0 and {args.count - 1}.")
+                sys.exit(1)
+            database = load_hash_database(args.db)
+            ini_entries = match_set_a(args.set_a, args.set_b, database, args.verify_dir,
+                                      args.index, args.count, args.prefix_length)
+            write_shard_result(ini_entries, args.result, args.index, args.count,
+                               args.prefix_length, file_digest(args.db))
+
+        elif args.command == "balance":
+            ppsspp_hashes = (os.path.splitext(os.path.basename(path))[0]
+                             for path in iter_files(args.set_a, extensions=(".png",)))
+            counts, balanced = check_shard_balance(ppsspp_hashes, args.count, args.prefix_length)
+            print(f"--- Shard balance for {sum(counts)} files in {args.set_a} ---")
+            for shard_index, count in enumerate(counts):
+                print(f"  Shard {shard_index}: {count}")
+            if not balanced:
+                print(f"Error: Shards are unbalanced (tolerance {shard_balance_tolerance:.0%}). "
+                      "Try a longer --prefix-length or 0.")
+                sys.exit(1)
+            print("Shards are balanced.")
+
+        elif args.command == "merge":
+            try:
+                merge_shard_results(args.results, args.output)
+            except ValueError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+
+        else:
+            # Phase 1 - Build or load the Set B hash database
+            hash_db = build_hash_database(args.set_b, args.cache)
+
+            # Phase 2 - Match Set A and write textures.ini
+            if hash_db:
+                match_and_generate_ini(args.set_a, args.set_b, hash_db, args.output)
+            else:
+                print("Error: Hash database is empty. Check Set B folder path.")
+
+    except FileNotFoundError as e:
+        print(f"\n*** FATAL ERROR ***")
+        print(f"Could not find: {e.filename}")
+        print("Please check your paths.")
+        sys.exit(1)
+    except OSError as e:
+        print(f"\n*** FATAL ERROR ***")
+        print(f"{e}")
+        sys.exit(1)
+
+    end_time = time.time()
+    print(f"Total time taken: {end_time - start_time:.2f} seconds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,172 @@
 import os
-import subprocess
 import sys
+from batch_planner import order_jobs, plan_jobs, print_plan, run_jobs
+from dir_scanner import iter_files
+from game_profiles import PROFILES, get_profile, profile_path
+from image_overlay import add_title_arguments, overlay_for_profiles, title_style_from_args
 
-def run_overlay_for_directory(target_directory):
+def run_overlay_for_directory(target_directory, include=None, exclude=None, profiles=None, fused=False,
+                              title_style=None):
     """
-    Finds all .png files in the specified directory and its subdirectories,
-    then runs the image_overlay.py script for each of them.
+    Streams the .png files in the specified directory and its subdirectories,
+    overlaying each one as soon as it is found. Each source is decoded once
+    and written for every selected game profile.
+
+    Args:
+        target_directory (str): The directory to scan.
+        include (list): Glob patterns a file name must match to be processed.
+        exclude (list): Glob patterns for files and subdirectories to skip.
+        profiles (list): The game profiles to render. Defaults to the
+            working directory layout with cards.csv.
+        fused (bool): Render small thumbnails with the fused mode (no intermediate canvas).
+        title_style (dict): If given (see image_overlay.render_card_title), also typeset each
+            card name into its large textures.
     """
     if not os.path.isdir(target_directory):
         print(f"Error: Directory not found at '{target_directory}'")
         sys.exit(1)
 
+    if not profiles:
+        profiles = [get_profile(None)]
+    print(f"Target profiles: {', '.join(profile['name'] for profile in profiles)}")
     print(f"Scanning for .png files in '{target_directory}'...")
-    
-    png_files = []
-    for root, _, files in os.walk(target_directory):
-        for file in files:
-            if file.lower().endswith('.png'):
-                full_path = os.path.join(root, file)
-                png_files.append(full_path)
-
-    if not png_files:
-        print(f"No .png files found to process in '{target_directory}'.")
-        return
 
-    print(f"Found {len(png_files)} .png files to process.")
-
-    for png_file in png_files:
+    processed_count = 0
+    for png_file in iter_files(target_directory, extensions=(".png",), include=include, exclude=exclude):
+        processed_count += 1
         print(f"\n--- Processing {png_file} ---")
         try:
-            # Use sys.executable to ensure we're using the same python interpreter
-            # Pass the full path of the png file to the overlay script
-            subprocess.run(
-                [sys.executable, "image_overlay.py", png_file], 
-                check=True
-            )
-            print(f"Successfully processed {png_file}")
-        except subprocess.CalledProcessError as e:
+            written = overlay_for_profiles(png_file, profiles, fused=fused, title_style=title_style)
+            if written:
+                print(f"Successfully processed {png_file} for {', '.join(written)}")
+            else:
+                print(f"Error processing {png_file}: not found in any catalog.")
+        except Exception as e:
             print(f"Error processing {png_file}: {e}")
-        except FileNotFoundError:
-            print(f"Error: 'image_overlay.py' not found. Make sure it is in the same directory as this script.")
-            sys.exit(1)
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python run_all.py <directory_path>")
-        print("Example: python run_all.py \"C:\\path\\to\\images\"")
+    if not processed_count:
+        print(f"No .png files found to process in '{target_directory}'.")
+        return
+
+    print(f"\nProcessed {processed_count} .png files.")
+
+def run_planned_batch(target_directory, include=None, exclude=None, profiles=None, fused=False, dry_run=False,
+                      title_style=None):
+    """
+    Resolves every card's image ID and tiny atlas slot first, then processes
+    the cards grouped by destination atlas so each atlas is loaded and saved
+    once per group instead of once per card.
+
+    Args:
+        target_directory (str): The directory to scan.
+        include (list): Glob patterns a file name must match to be processed.
+        exclude (list): Glob patterns for files and subdirectories to skip.
+        profiles (list): The game profiles to render. Defaults to the
+            working directory layout with cards.csv.
+        fused (bool): Render small thumbnails with the fused mode (no intermediate canvas).
+        dry_run (bool): Only print the plan (job graph, atlas touches and
+            estimated cost) without writing anything.
+        title_style (dict): If given (see image_overlay.render_card_title), also typeset each
+            card name into its large textures.
+    """
+    if not os.path.isdir(target_directory):
+        print(f"Error: Directory not found at '{target_directory}'")
         sys.exit(1)
-        
-    input_directory = sys.argv[1]
-    run_overlay_for_directory(input_directory)
+
+    if not profiles:
+        profiles = [get_profile(None)]
+    print(f"Target profiles: {', '.join(profile['name'] for profile in profiles)}")
+    print(f"Planning .png files in '{target_directory}'...")
+
+    source_paths = iter_files(target_directory, extensions=(".png",), include=include, exclude=exclude)
+    try:
+        jobs, skipped = plan_jobs(source_paths, profiles)
+    except Exception as e:
+        print(f"Error: Could not plan the batch: {e}")
+        sys.exit(1)
+    if not jobs:
+        print(f"No .png files could be planned in '{target_directory}'.")
+        for source_path, profile_name, reason in skipped:
+            print(f"  {profile_name}: {source_path} ({reason})")
+        return
+
+    ordered_jobs = order_jobs(jobs)
+    print_plan(ordered_jobs, skipped, discovery_order_jobs=jobs)
+    if dry_run:
+        return
+
+    failed = run_jobs(ordered_jobs, fused, title_style)
+    print(f"\nProcessed {len(ordered_jobs)} .png files ({failed} failed).")
+
+def main(argv=None, prog=None):
+    """Runs the command line interface. argv defaults to sys.argv[1:]."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Overlay every .png in a directory tree onto the game textures.",
+        epilog="Example: python run_all.py \"C:\\path\\to\\images\" --profile TF5 --profile TFSP")
+    parser.add_argument("directory", type=str, help="The directory containing the source images.")
+    parser.add_argument("--include", action="append", default=None,
+                        help="Only process files whose name matches this glob pattern (repeatable).")
+    parser.add_argument("--exclude", action="append", default=None,
+                        help="Skip files and subdirectories whose name matches this glob pattern (repeatable).")
+    parser.add_argument("--profile", action="append", dest="profiles", default=None,
+                        help=f"Game profile to render (repeatable): {', '.join(PROFILES)}, or 'all'. "
+                             "Default: cards.csv and the folders in the working directory.")
+    parser.add_argument("--fused", action="store_true",
+                        help="Render small thumbnails without the 400x583 card canvas and its full-canvas resize.")
+    add_title_arguments(parser)
+    parser.add_argument("--decode-memory-mb", type=float, default=None,
+                        help="Ceiling for the decoded pixels of one source image: larger JPEGs are "
+                             "decoded at a smaller scale, other images are skipped "
+                             "(default: TAG_FORCE_DECODE_MEMORY_MB or 512).")
+    parser.add_argument("--plan", action="store_true",
+                        help="Dry run: print the job graph, atlas touches and estimated cost, then exit.")
+    parser.add_argument("--unordered", action="store_true",
+                        help="Skip planning and process files in the order they are found.")
+    parser.add_argument("--export-pack", type=str, default=None,
+                        help="After processing, export output/ into this zipped PPSSPP texture pack.")
+    parser.add_argument("--ini", type=str, default=None,
+                        help="textures.ini to include in the exported pack (used with --export-pack).")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only replace the pack entries that changed (used with --export-pack).")
+
+    args = parser.parse_args(argv)
+
+    profile_names = args.profiles or []
+    if "all" in (name.lower() for name in profile_names):
+        profile_names = list(PROFILES)
+    try:
+        profiles = [get_profile(name) for name in profile_names]
+    except KeyError as e:
+        print(f"Error: {e.args[0]}")
+        sys.exit(1)
+
+    if args.export_pack and len(profiles) > 1:
+        print("Error: --export-pack exports a single game. Select one profile, or export each with texture_pack_exporter.py.")
+        sys.exit(1)
+
+    if args.decode_memory_mb is not None:
+        from image_decoder import set_memory_limit
+        set_memory_limit(args.decode_memory_mb)
+
+    if args.plan and args.unordered:
+        print("Error: --plan and --unordered cannot be used together.")
+        sys.exit(1)
+
+    title_style = title_style_from_args(args)
+    if args.unordered:
+        run_overlay_for_directory(args.directory, args.include, args.exclude, profiles, args.fused, title_style)
+    else:
+        run_planned_batch(args.directory, args.include, args.exclude, profiles, args.fused, dry_run=args.plan,
+                          title_style=title_style)
+
+    if args.export_pack and not args.plan:
+        from texture_pack_exporter import export_texture_pack
+        output_root = profile_path(profiles[0] if profiles else get_profile(None), "output")
+        print(f"\n--- Exporting texture pack to {args.export_pack} ---")
+        export_texture_pack(output_root, args.export_pack, args.ini, incremental=args.incremental)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import os
+import sys
+
+# --- Subcommands ---
+# {command: (module, description)}. Modules are only imported when their
+# command runs, so starting the CLI never pays for Pillow, NumPy or imagehash.
+COMMANDS = {
+    "overlay": ("image_overlay", "Overlay one card image onto the large, small and tiny textures."),
+    "batch": ("run_all", "Overlay every .png in a directory tree (plans by atlas, --plan for a dry run)."),
+    "crop": ("tag_force_cropper", "Crop a source image into the large texture layout."),
+    "small": ("tag_force_small_thumb_generator", "Create a small thumbnail overlay."),
+    "tiny": ("tag_force_tiny_thumb_finder", "Find a card's cell in the tiny atlases."),
+    "title": ("card_name_typesetter", "Typeset a card name into a title strip."),
+    "match": ("phash_matcher", "Match a PPSSPP texture dump and write textures.ini (build-db/shard/merge)."),
+    "export": ("texture_pack_exporter", "Export the outputs as a zipped PPSSPP texture pack."),
+    "scan": ("dir_scanner", "Stream the files in a directory tree."),
+    "decode": ("image_decoder", "Check reduced-size decoding against full decoding."),
+}
+
+# Modules that must never be imported just to start the CLI.
+HEAVY_MODULES = ("PIL", "numpy", "imagehash", "scipy", "pywt")
+
+
+def run_command(command, argv):
+    """
+    Imports the module behind a subcommand and runs its main().
+
+    Args:
+        command (str): The subcommand name (a key of COMMANDS).
+        argv (list): The arguments after the subcommand.
+    """
+    import importlib
+
+    module_name, _ = COMMANDS[command]
+    module = importlib.import_module(module_name)
+    module.main(argv, prog=f"{os.path.basename(sys.argv[0])} {command}")
+
+
+def _run_importtime(arguments):
+    """
+    Runs a fresh interpreter with python -X importtime and the given
+    arguments, and parses its report.
+
+    Returns:
+        list: (depth, package, cumulative_ms) per imported package, in the
+        order reported. A package's nested imports (depth + 1) are listed
+        just before the package itself.
+    """
+    import subprocess
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + arguments,
+        cwd=script_dir,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise ImportError(f"Could not run {' '.join(arguments)}: {result.stderr.strip().splitlines()[-1]}")
+
+    # Lines look like: "import time:  self [us] | cumulative | imported package",
+    # with the package name indented two spaces per nesting level.
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((depth, name.strip(), int(cumulative) / 1000))
+    return imports
+
+
+def measure_import_time(module_name, repeat=3):
+    """
+    Measures how long a fresh interpreter takes to import a module, using
+    python -X importtime.
+
+    Args:
+        module_name (str): The module to import.
+        repeat (int): Number of runs; the fastest is kept to reduce noise.
+
+    Returns:
+        dict: {"module", "cumulative_ms", "direct": {package: ms}, "all": set}
+        for the fastest run. "direct" holds the module's direct imports and
+        "all" the top-level name of every package imported.
+    """
+    best = None
+
+    for _ in range(repeat):
+        cumulative_ms = 0.0
+        direct = {}
+        children = {}
+        all_packages = set()
+        for depth, name, package_ms in _run_importtime(["-c", f"import {module_name}"]):
+            all_packages.add(name.split(".")[0])
+            if depth == 1:
+                children[name] = children.get(name, 0) + package_ms
+            elif depth == 0:
+                if name == module_name:
+                    cumulative_ms = package_ms
+                    direct = children
+                children = {}
+
+        if best is None or cumulative_ms < best["cumulative_ms"]:
+            best = {"module": module_name, "cumulative_ms": cumulative_ms, "direct": direct, "all": all_packages}
+
+    return best
+
+
+def measure_cli_import_time(argv, repeat=3):
+    """
+    Measures the imports paid for by actually running the CLI (tag_force.py
+    with the given arguments), on top of interpreter startup.
+
+    Args:
+        argv (list): Arguments for tag_force.py, e.g. ["-h"].
+        repeat (int): Number of runs; the fastest is kept to reduce noise.
+
+    Returns:
+        dict: Same keys as measure_import_time, with "module" set to the
+        command line. "direct" holds the top-level imports the run made.
+    """
+    startup = {name for _, name, _ in _run_importtime(["-c", "pass"])}
+    command = " ".join(["tag_force.py"] + argv)
+    best = None
+
+    for _ in range(repeat):
+        direct = {}
+        all_packages = set()
+        for depth, name, package_ms in _run_importtime([os.path.basename(__file__)] + argv):
+            if name in startup:
+                continue
+            all_packages.add(name.split(".")[0])
+            if depth == 0:
+                direct[name] = direct.get(name, 0) + package_ms
+        cumulative_ms = sum(direct.values())
+
+        if best is None or cumulative_ms < best["cumulative_ms"]:
+            best = {"module": command, "cumulative_ms": cumulative_ms, "direct": direct, "all": all_packages}
+
+    return best
+
+
+def report_import_times(repeat=3, budget_ms=None):
+    """
+    Prints an import-time report for the CLI entry point, a real CLI run
+    (tag_force.py -h) and every subcommand module, and checks the entry
+    point and the CLI run against the budget.
+
+    Args:
+        repeat (int): Runs per module; the fastest is reported.
+        budget_ms (float): Maximum import time for the entry point and the CLI run.
+
+    Returns:
+        bool: False if the entry point or the CLI run imports a heavy module
+        or exceeds budget_ms.
+    """
+    print("--- Import time report (python -X importtime, fastest of "
+          f"{repeat} run{'s' if repeat != 1 else ''}) ---")
+    print(f"  {'module':<34} {'cumulative':>10}   heaviest imports")
+
+    # (label, measure, checked): the entry point and the CLI run must stay light
+    measurements = [
+        ("tag_force", lambda: measure_import_time("tag_force", repeat), True),
+        ("tag_force.py -h", lambda: measure_cli_import_time(["-h"], repeat), True),
+    ]
+    measurements += [(module_name, lambda module_name=module_name: measure_import_time(module_name, repeat), False)
+                     for module_name, _ in COMMANDS.values()]
+
+    ok = True
+    for label, measure, checked in measurements:
+        try:
+            timing = measure()
+        except ImportError as e:
+            print(f"  {label:<34} {'-':>10}   {e}")
+            if checked:
+                ok = False
+            continue
+
+        heaviest = sorted(timing["direct"].items(), key=lambda item: item[1], reverse=True)[:3]
+        heaviest_text = ", ".join(f"{name} {ms:.0f} ms" for name, ms in heaviest)
+        print(f"  {label:<34} {timing['cumulative_ms']:>7.1f} ms   {heaviest_text}")
+
+        if checked:
+            heavy = [name for name in HEAVY_MODULES if name in timing["all"]]
+            if heavy:
+                print(f"  Regression: {label} imports {', '.join(heavy)} at startup.")
+                ok = False
+            if budget_ms is not None and timing["cumulative_ms"] > budget_ms:
+                print(f"  Regression: {label} spends {timing['cumulative_ms']:.1f} ms "
+                      f"on imports (budget {budget_ms:.1f} ms).")
+                ok = False
+
+    return ok
+
+
+def main(argv=None):
+    """Runs the command line interface. argv defaults to sys.argv[1:]."""
+    import argparse
+
+    if argv is None:
+        argv = sys.argv[1:]
+
+    command_list = "\n".join(f"  {name:<10} {description}" for name, (_, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        description="Yu-Gi-Oh! Tag Force card art modding tools.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"commands:\n{command_list}\n"
+               "  importtime Report import times and catch startup regressions.\n\n"
+               "Run '<command> -h' for the options of each command.")
+    parser.add_argument("command", choices=list(COMMANDS) + ["importtime"], metavar="command")
+
+    # Only parse the command name here; everything after it belongs to the subcommand
+    args = parser.parse_args(argv[:1])
+    command_argv = argv[1:]
+
+    if args.command == "importtime":
+        importtime_parser = argparse.ArgumentParser(
+            prog=f"{os.path.basename(sys.argv[0])} importtime",
+            description="Report how long each tool takes to import and fail if the entry point "
+                        "imports heavy modules or exceeds its budget.")
+        importtime_parser.add_argument("--repeat", type=int, default=3, help="Runs per module (default: 3).")
+        importtime_parser.add_argument("--budget-ms", type=float, default=None,
+                                       help="Fail if the entry point takes longer than this to import.")
+        importtime_args = importtime_parser.parse_args(command_argv)
+        if not report_import_times(importtime_args.repeat, importtime_args.budget_ms):
+            sys.exit(1)
+        return
+
+    run_command(args.command, command_argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,35 @@
 import sys
 import os
 from PIL import Image
+from game_profiles import TAG_FORCE_LAYOUT
+from image_decoder import open_for_size
+
+def crop_to_layout(source_img, layout=TAG_FORCE_LAYOUT):
+    """
+    Resizes the source image to the layout's source size if necessary, then
+    crops its rectangular parts and arranges them on a new transparent canvas.
+
+    Args:
+        source_img (PIL.Image.Image): The source image.
+        layout (dict): The game layout (see game_profiles).
+
+    Returns:
+        PIL.Image.Image: The RGBA large texture overlay.
+    """
+    # Check and resize the image if it's not the required size
+    required_source_size = layout["source_size"]
+    if source_img.size != required_source_size:
+        # Use LANCZOS for high-quality downsampling
+        source_img = source_img.resize(required_source_size, Image.Resampling.LANCZOS)
+
+    # Create a new transparent canvas for the destination image
+    dest_img = Image.new('RGBA', layout["large_size"], (0, 0, 0, 0))
+
+    # Crop each part from the (potentially resized) source and paste it into place
+    for crop_box, paste_pos in layout["large_regions"]:
+        dest_img.paste(source_img.crop(crop_box), paste_pos)
+
+    return dest_img
 
 def transform_image(source_path, dest_path):
     """
@@ -9,8 +38,9 @@ def transform_image(source_path, dest_path):
     rectangular parts and arranges them on a new transparent canvas.
     """
     try:
-        # 1. Load the source image from the provided path
-        source_img = Image.open(source_path)
+        # 1. Load the source image from the provided path, decoding no more
+        #    of an oversized image than the resize needs
+        source_img = open_for_size(source_path, TAG_FORCE_LAYOUT["source_size"])
     except FileNotFoundError:
         print(f"Error: The source file '{source_path}' was not found.")
         return
@@ -18,57 +48,34 @@ def transform_image(source_path, dest_path):
         print(f"An error occurred while opening the image: {e}")
         return
 
-    # 2. Check and resize the image if it's not 312x312
-    required_source_size = (312, 312)
-    if source_img.size != required_source_size:
-        print(f"Source image is not {required_source_size}. Resizing...")
-        # Use LANCZOS for high-quality downsampling
-        source_img = source_img.resize(required_source_size, Image.Resampling.LANCZOS)
-
-    # 3. Define the crop regions for the 312x312 source image
-    red_crop_box = (0, 0, 312, 240)
-    yellow_crop_box = (0, 240, 192, 312)
-    green_crop_box = (192, 240, 312, 312)
-
-    # 4. Crop the parts from the (potentially resized) source image
-    red_part = source_img.crop(red_crop_box)
-    yellow_part = source_img.crop(yellow_crop_box)
-    green_part = source_img.crop(green_crop_box)
-
-    # 5. Create a new transparent canvas for the destination image
-    dest_size = (512, 256)
-    dest_img = Image.new('RGBA', dest_size, (0, 0, 0, 0))
-
-    # 6. Define the scaled positions to paste the cropped parts
-    red_paste_pos = (0, 0)
-    yellow_paste_pos = (320, 0)
-    green_paste_pos = (320, 80)
+    # 2. Resize, crop and arrange the parts on a transparent canvas
+    if source_img.size != TAG_FORCE_LAYOUT["source_size"]:
+        print(f"Source image is not {TAG_FORCE_LAYOUT['source_size']}. Resizing...")
+    dest_img = crop_to_layout(source_img)
 
-    # 7. Paste the parts onto the new canvas
-    dest_img.paste(red_part, red_paste_pos)
-    dest_img.paste(yellow_part, yellow_paste_pos)
-    dest_img.paste(green_part, green_paste_pos)
-    
-    # 8. Convert to PNG8 before saving.
+    # 3. Convert to PNG8 before saving.
     print("Converting image to PNG8 for compression...")
     dest_img = dest_img.quantize(colors=256, dither=Image.Dither.FLOYDSTEINBERG)
 
-    # 9. Save the final, compressed image.
+    # 4. Save the final, compressed image.
     dest_img.save(dest_path)
     print(f"Transformation complete. Image saved as '{dest_path}'")
 
-# This is the main execution block
-if __name__ == "__main__":
-    # sys.argv is a list containing command-line arguments.
-    # sys.argv[0] is the script name.
-    # sys.argv[1] is the first argument (the file path).
-    if len(sys.argv) < 2:
+def main(argv=None, prog=None):
+    """Runs the command line interface. argv defaults to sys.argv[1:]."""
+    # argv holds the command-line arguments after the script name.
+    # argv[0] is the first argument (the file path).
+    if argv is None:
+        argv = sys.argv[1:]
+    if prog is None:
+        prog = "python tag_force_cropper.py"
+    if len(argv) < 1:
         print("Usage: Drag and drop a PNG file onto this script.")
-        print("Or run from the command line: python tag_force_cropper.py <path_to_your_image>")
+        print(f"Or run from the command line: {prog} <path_to_your_image>")
         sys.exit() # Exit the script if no file is provided.
 
     # Get the input file path from the command-line argument
-    input_path = sys.argv[1]
+    input_path = argv[0]
 
     # Automatically create a name for the output file
     # e.g., 'C:\\Users\\Me\\Desktop\\photo.png'
@@ -77,4 +84,8 @@ if __name__ == "__main__":
     output_path = f"{path_without_ext}_processed{ext}"
 
     # Run the main function with the provided file paths
-    transform_image(source_path=input_path, dest_path=output_path)
\ No newline at end of file
+    transform_image(source_path=input_path, dest_path=output_path)
+
+# This is the main execution block
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,115 @@
 import sys
 import os
-from PIL import Image
+import math
+import time
+from PIL import Image, ImageChops
+from game_profiles import TAG_FORCE_LAYOUT
+from image_decoder import open_for_size
 
-def create_small_thumbnail(input_image_path):
+# Maximum per-channel difference (0-255, on premultiplied RGBA) allowed between
+# the fused and the two-step thumbnail. Card art and RGB noise stay at 5 for
+# any source size; noise in the alpha channel is the worst case, at 13.
+FUSED_MAX_PIXEL_DIFF = 16
+
+def render_small_thumbnail(source_image, fused=False, layout=TAG_FORCE_LAYOUT):
+    """
+    Renders the small thumbnail overlay for a source image.
+
+    The two-step mode resizes the source to 305x305, pastes it at (48, 106)
+    on a 400x583 canvas and resizes that canvas to 256x256. The fused mode
+    resizes the source to 305x305 the same way, then resamples only the
+    art into its final placement, skipping the 400x583 canvas and the
+    full-canvas resize. It stays within FUSED_MAX_PIXEL_DIFF of the
+    two-step result.
+
+    Args:
+        source_image (PIL.Image.Image): The source image, in RGBA mode.
+        fused (bool): Use the fused mode (no intermediate canvas).
+        layout (dict): The game layout (see game_profiles). The sizes above
+            are those of the Tag Force layout.
+
+    Returns:
+        PIL.Image.Image: The RGBA thumbnail.
+    """
+    if fused:
+        return _render_small_thumbnail_fused(source_image, layout)
+
+    # Resize the source image to the art size (305x305)
+    resized_image = source_image.resize(layout["small_art_size"], Image.Resampling.LANCZOS)
+
+    # Create a new blank card canvas (400x583)
+    canvas = Image.new('RGBA', layout["small_canvas_size"], (0, 0, 0, 0))
+
+    # Overlay the resized image onto the canvas at the art position (48, 106)
+    canvas.paste(resized_image, layout["small_art_position"])
+
+    # Resize the entire canvas to the thumbnail size (256x256)
+    return canvas.resize(layout["small_size"], Image.Resampling.LANCZOS)
+
+def _render_small_thumbnail_fused(source_image, layout):
+    """
+    Fused version of the two-step small thumbnail transform: the art is
+    resized exactly as in the first step, then resampled straight into its
+    final placement instead of being pasted on the canvas and resizing the
+    whole canvas. Both modes resample twice.
+
+    Resampling the source straight into place (without the first resize)
+    is faster still, but near the art size (305-400 px, including the
+    312x312 pipeline input) it drifts up to 36 levels from the two-step
+    output on noisy art, because it skips the first resize's near 1:1
+    filtering.
+    """
+    source_image = source_image.resize(layout["small_art_size"], Image.Resampling.LANCZOS)
+    source_width, source_height = source_image.size
+    art_width, art_height = layout["small_art_size"]
+    art_x, art_y = layout["small_art_position"]
+    canvas_width, canvas_height = layout["small_canvas_size"]
+    scale_x = layout["small_size"][0] / canvas_width
+    scale_y = layout["small_size"][1] / canvas_height
+
+    # Where the art ends up in the final thumbnail (fractional pixels)
+    left, right = art_x * scale_x, (art_x + art_width) * scale_x
+    top, bottom = art_y * scale_y, (art_y + art_height) * scale_y
+    # Output pixels touched by the art, and how many source pixels map to one output pixel
+    dest_box = (math.floor(left), math.floor(top), math.ceil(right), math.ceil(bottom))
+    source_per_dest_x = source_width / (right - left)
+    source_per_dest_y = source_height / (bottom - top)
+
+    # The partially covered edge pixels sample outside the source, so give it a
+    # transparent border, as the two-step canvas does.
+    pad = math.ceil(max(source_per_dest_x, source_per_dest_y)) + 1
+    padded_source = Image.new('RGBA', (source_width + 2 * pad, source_height + 2 * pad), (0, 0, 0, 0))
+    padded_source.paste(source_image, (pad, pad))
+
+    source_box = (
+        pad + (dest_box[0] - left) * source_per_dest_x,
+        pad + (dest_box[1] - top) * source_per_dest_y,
+        pad + (dest_box[2] - left) * source_per_dest_x,
+        pad + (dest_box[3] - top) * source_per_dest_y,
+    )
+    dest_size = (dest_box[2] - dest_box[0], dest_box[3] - dest_box[1])
+    placed_art = padded_source.resize(dest_size, Image.Resampling.LANCZOS, box=source_box)
+
+    final_image = Image.new('RGBA', layout["small_size"], (0, 0, 0, 0))
+    final_image.paste(placed_art, dest_box[:2])
+    return final_image
+
+def create_small_thumbnail(input_image_path, fused=False):
     """
     Processes an input image to create a small thumbnail for Tag Force.
 
     Args:
         input_image_path (str): The path to the source image.
+        fused (bool): Use the fused mode (no intermediate canvas).
     """
     try:
-        # Open the source image
-        source_image = Image.open(input_image_path).convert("RGBA")
+        # Open the source image, decoding no more of an oversized image than the resize needs
+        source_image = open_for_size(input_image_path, TAG_FORCE_LAYOUT["small_art_size"])
     except FileNotFoundError:
         print(f"Error: Input image not found at {input_image_path}")
         sys.exit(1)
 
-    # Resize the source image to 305x305
-    resized_image = source_image.resize((305, 305), Image.Resampling.LANCZOS)
-
-    # Create a new blank 400x583 canvas
-    canvas = Image.new('RGBA', (400, 583), (0, 0, 0, 0))
-
-    # Overlay the resized image onto the canvas at position (48, 106)
-    canvas.paste(resized_image, (48, 106))
-
-    # Resize the entire canvas to 256x256
-    final_image = canvas.resize((256, 256), Image.Resampling.LANCZOS)
+    final_image = render_small_thumbnail(source_image, fused)
 
     # Determine the output path
     base_name, extension = os.path.splitext(input_image_path)
@@ -36,18 +119,88 @@ def create_small_thumbnail(input_image_path):
     final_image.save(output_path)
     print(f"Successfully created small thumbnail: {output_path}")
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python tag_force_small_thumb_generator.py <input_image>")
-        print("Example: python tag_force_small_thumb_generator.py image_source.png")
-        sys.exit(1)
+def max_pixel_diff(image_a, image_b):
+    """
+    Returns the largest per-channel difference between two RGBA images,
+    compared with premultiplied alpha so fully transparent pixels match.
+    """
+    difference = ImageChops.difference(image_a.convert("RGBa"), image_b.convert("RGBa"))
+    return max(high for _, high in difference.getextrema())
 
-    # Check if the Pillow library is installed
-    try:
-        from PIL import Image
-    except ImportError:
-        print("Pillow library not found. Please install it using: pip install Pillow")
-        sys.exit(1)
-        
-    input_image = sys.argv[1]
-    create_small_thumbnail(input_image)
+def benchmark_small_thumbnails(image_paths):
+    """
+    Times the two-step and fused modes on a batch of source images and
+    checks that the fused output stays within FUSED_MAX_PIXEL_DIFF.
+    Decoding is excluded from the timings.
+
+    Args:
+        image_paths (iterable): Paths to the source images.
+
+    Returns:
+        bool: False if any image differs by more than FUSED_MAX_PIXEL_DIFF.
+    """
+    two_step_total = 0.0
+    fused_total = 0.0
+    worst_diff = 0
+    card_count = 0
+
+    for image_path in image_paths:
+        with Image.open(image_path) as img:
+            source_image = img.convert("RGBA")
+
+        start = time.perf_counter()
+        two_step_image = render_small_thumbnail(source_image, fused=False)
+        two_step_total += time.perf_counter() - start
+
+        start = time.perf_counter()
+        fused_image = render_small_thumbnail(source_image, fused=True)
+        fused_total += time.perf_counter() - start
+
+        diff = max_pixel_diff(two_step_image, fused_image)
+        worst_diff = max(worst_diff, diff)
+        card_count += 1
+        if diff > FUSED_MAX_PIXEL_DIFF:
+            print(f"  Warning: {image_path} differs by {diff} (tolerance {FUSED_MAX_PIXEL_DIFF}).")
+
+    if not card_count:
+        print("No images to benchmark.")
+        return True
+
+    print(f"--- Small thumbnail benchmark ({card_count} cards) ---")
+    print(f"  Two-step: {two_step_total * 1000 / card_count:.2f} ms/card ({two_step_total:.2f} s total)")
+    print(f"  Fused:    {fused_total * 1000 / card_count:.2f} ms/card ({fused_total:.2f} s total)")
+    print(f"  Saved:    {(two_step_total - fused_total) * 1000 / card_count:.2f} ms/card")
+    print(f"  Largest pixel difference: {worst_diff} (tolerance {FUSED_MAX_PIXEL_DIFF})")
+    return worst_diff <= FUSED_MAX_PIXEL_DIFF
+
+def main(argv=None, prog=None):
+    """Runs the command line interface. argv defaults to sys.argv[1:]."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Create a small thumbnail overlay for Tag Force.",
+        epilog="Example: python tag_force_small_thumb_generator.py image_source.png")
+    parser.add_argument("input_image", type=str,
+                        help="The source image, or a folder of images when used with --benchmark.")
+    parser.add_argument("--fused", action="store_true",
+                        help="Skip the 400x583 card canvas and its full-canvas resize: resize the art, then map it into place directly.")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Compare the two-step and fused modes on the image (or every .png/.jpg in the folder).")
+
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        from dir_scanner import iter_files
+        if os.path.isdir(args.input_image):
+            within_tolerance = benchmark_small_thumbnails(iter_files(args.input_image, extensions=('.png', '.jpg', '.jpeg')))
+        else:
+            within_tolerance = benchmark_small_thumbnails([args.input_image])
+        if not within_tolerance:
+            print("Error: The fused mode exceeds its tolerance.")
+            sys.exit(1)
+    else:
+        create_small_thumbnail(args.input_image, args.fused)
+
+if __name__ == "__main__":
+    main()
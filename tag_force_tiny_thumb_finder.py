@@ -1,10 +1,13 @@
 import sys
 import os
-import numpy as np
 from PIL import Image
+from game_profiles import TAG_FORCE_LAYOUT
 
 def calculate_mse(imageA, imageB):
     """Calculates the Mean Squared Error between two images."""
+    # Imported here so the CLI starts without paying NumPy's import cost
+    import numpy as np
+
     # Convert images to numpy arrays
     arrA = np.array(imageA)
     arrB = np.array(imageB)
@@ -19,100 +22,165 @@ def calculate_mse(imageA, imageB):
     # the two images are
     return err
 
-def find_best_match(image_id):
+def locate_in_atlases(small_image, tiny_dir="tiny", layout=TAG_FORCE_LAYOUT):
     """
-    Finds the best match for a small image within a directory of atlas images.
+    Finds the atlas cell that best matches a small image.
 
     Args:
-        image_id (str): The ID of the image to find.
+        small_image (PIL.Image.Image): The small (256x256) card image, in RGBA mode.
+        tiny_dir (str): The directory holding the tiny atlases.
+        layout (dict): The game layout (see game_profiles), giving the atlas geometry.
+
+    Returns:
+        dict: {"file", "x_index", "y_index", "pixel_x", "pixel_y", "mse"} for
+        the best match, or None if no atlas was found.
+
+    Raises:
+        FileNotFoundError: If tiny_dir does not exist.
     """
-    # --- 1. Load and Prepare the Source Image ---
-    small_image_path = os.path.join("small", f"{image_id}.png")
-    try:
-        source_image = Image.open(small_image_path).convert("RGBA")
-    except FileNotFoundError:
-        print(f"Error: Source image not found at '{small_image_path}'")
-        sys.exit(1)
+    return locate_many_in_atlases([(None, small_image)], tiny_dir, layout)[None]
 
-    # Resize the source image to the target dimensions for comparison
-    needle_image = source_image.resize((88, 120), Image.Resampling.LANCZOS)
-    print(f"Loaded and resized '{small_image_path}' to 88x120 for matching.")
+def locate_many_in_atlases(small_images, tiny_dir="tiny", layout=TAG_FORCE_LAYOUT):
+    """
+    Finds the best matching atlas cell for many small images at once.
+
+    Every image is first shrunk to the atlas cell size, then the atlases
+    are decoded one at a time and each is compared against all the images
+    still being searched. Only one decoded atlas is held in memory,
+    however many atlases and cards there are, and each atlas is decoded
+    once. The results are the same as calling locate_in_atlases per image.
+
+    Args:
+        small_images (iterable): (key, small RGBA image) pairs. Consumed
+            lazily, so the full-size images need not all be open at once.
+        tiny_dir (str): The directory holding the tiny atlases.
+        layout (dict): The game layout (see game_profiles), giving the atlas geometry.
+
+    Returns:
+        dict: {key: best match (as from locate_in_atlases) or None}.
+
+    Raises:
+        FileNotFoundError: If tiny_dir does not exist.
+    """
+    sub_image_width, sub_image_height = layout["atlas_cell_size"]
+    cols = layout["atlas_cols"]
+    rows = layout["atlas_rows"]
 
-    # --- 2. Define Atlas Parameters ---
-    tiny_dir = "tiny"
     if not os.path.isdir(tiny_dir):
-        print(f"Error: Directory '{tiny_dir}/' not found.")
-        sys.exit(1)
+        raise FileNotFoundError(f"Directory '{tiny_dir}/' not found.")
 
-    sub_image_width = 88
-    sub_image_height = 120
-    cols = 23
-    rows = 17
+    # Resize the source images to the target dimensions for comparison
+    needles = {}
+    for key, small_image in small_images:
+        needles[key] = small_image.resize((sub_image_width, sub_image_height), Image.Resampling.LANCZOS)
 
-    best_match = {
-        "file": None,
-        "x_index": -1,
-        "y_index": -1,
-        "mse": float('inf')
+    best_matches = {
+        key: {"file": None, "x_index": -1, "y_index": -1, "mse": float('inf')}
+        for key in needles
     }
 
-    # --- 3. Crawl Through Atlases and Find the Best Match ---
+    # --- Crawl Through Atlases and Find the Best Matches ---
     print(f"Searching for best match in atlases in '{tiny_dir}/'...")
     atlas_files = [f for f in os.listdir(tiny_dir) if f.endswith(('.png', '.jpg', '.jpeg'))]
 
     if not atlas_files:
         print(f"No image atlases found in '{tiny_dir}/'.")
-        sys.exit(1)
+        return {key: None for key in needles}
 
+    # Images are dropped from the search once they have a perfect match
+    searching = dict(needles)
     for atlas_filename in atlas_files:
-        atlas_path = os.path.join(tiny_dir, atlas_filename)
+        if not searching:
+            break
         print(f"  - Processing atlas: {atlas_filename}")
-        atlas_image = Image.open(atlas_path).convert("RGBA")
-
-        for r in range(rows):
-            for c in range(cols):
-                # Define the box for the sub-image
-                left = c * sub_image_width
-                top = r * sub_image_height
-                right = left + sub_image_width
-                bottom = top + sub_image_height
-                
-                # Crop the sub-image from the atlas
-                haystack_image = atlas_image.crop((left, top, right, bottom))
-                
-                # Compare with the needle
-                mse = calculate_mse(needle_image, haystack_image)
-                
-                # If it's a better match, update our records
-                if mse < best_match["mse"]:
-                    best_match["mse"] = mse
-                    best_match["file"] = atlas_filename
-                    best_match["x_index"] = c
-                    best_match["y_index"] = r
-                    # If we find a perfect match, we can stop early
-                    if mse == 0:
-                        break
+        atlas_image = Image.open(os.path.join(tiny_dir, atlas_filename)).convert("RGBA")
+
+        for key, needle_image in list(searching.items()):
+            best_match = best_matches[key]
+            mse = None
+            for r in range(rows):
+                for c in range(cols):
+                    # Define the box for the sub-image
+                    left = c * sub_image_width
+                    top = r * sub_image_height
+                    right = left + sub_image_width
+                    bottom = top + sub_image_height
+
+                    # Crop the sub-image from the atlas
+                    haystack_image = atlas_image.crop((left, top, right, bottom))
+
+                    # Compare with the needle
+                    mse = calculate_mse(needle_image, haystack_image)
+
+                    # If it's a better match, update our records
+                    if mse < best_match["mse"]:
+                        best_match["mse"] = mse
+                        best_match["file"] = atlas_filename
+                        best_match["x_index"] = c
+                        best_match["y_index"] = r
+                        # If we find a perfect match, we can stop early
+                        if mse == 0:
+                            break
+                if mse == 0:
+                    break
             if mse == 0:
-                break
-        if mse == 0:
-            break
-            
-    # --- 4. Return the Result ---
-    if best_match["file"]:
-        pixel_x = best_match['x_index'] * sub_image_width
-        pixel_y = best_match['y_index'] * sub_image_height
+                del searching[key]
+
+        # Free the decoded atlas before the next one is loaded
+        del atlas_image
+
+    results = {}
+    for key, best_match in best_matches.items():
+        if not best_match["file"]:
+            results[key] = None
+            continue
+        best_match["pixel_x"] = best_match["x_index"] * sub_image_width
+        best_match["pixel_y"] = best_match["y_index"] * sub_image_height
+        results[key] = best_match
+    return results
+
+def find_best_match(image_id):
+    """
+    Finds the best match for a small image within a directory of atlas images.
+
+    Args:
+        image_id (str): The ID of the image to find.
+    """
+    # --- 1. Load the Source Image ---
+    small_image_path = os.path.join("small", f"{image_id}.png")
+    try:
+        source_image = Image.open(small_image_path).convert("RGBA")
+    except FileNotFoundError:
+        print(f"Error: Source image not found at '{small_image_path}'")
+        sys.exit(1)
+    print(f"Loaded '{small_image_path}', matching at 88x120.")
+
+    # --- 2. Search the Atlases ---
+    try:
+        best_match = locate_in_atlases(source_image, "tiny")
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    # --- 3. Return the Result ---
+    if best_match:
         print("\n--- Match Found! ---")
         print(f"Atlas File: {best_match['file']}")
-        print(f"Best Match Pixel X: {pixel_x}")
-        print(f"Best Match Pixel Y: {pixel_y}")
+        print(f"Best Match Pixel X: {best_match['pixel_x']}")
+        print(f"Best Match Pixel Y: {best_match['pixel_y']}")
         print(f"Confidence (MSE): {best_match['mse']:.2f} (lower is better)")
     else:
         print("\nCould not find a suitable match in any atlas.")
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python tag_force_tiny_thumb_finder.py <image_id>")
-        print("Example: python tag_force_tiny_thumb_finder.py 4007")
+def main(argv=None, prog=None):
+    """Runs the command line interface. argv defaults to sys.argv[1:]."""
+    if argv is None:
+        argv = sys.argv[1:]
+    if prog is None:
+        prog = "python tag_force_tiny_thumb_finder.py"
+    if len(argv) != 1:
+        print(f"Usage: {prog} <image_id>")
+        print(f"Example: {prog} 4007")
         sys.exit(1)
 
     # Check for dependencies
@@ -124,5 +192,8 @@ if __name__ == "__main__":
         print("pip install Pillow numpy")
         sys.exit(1)
 
-    image_id_arg = sys.argv[1]
+    image_id_arg = argv[0]
     find_best_match(image_id_arg)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import os
+import sys
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dir_scanner import iter_files
+
+# Output subfolders that are packed, relative to the output root.
+PACK_SUBFOLDERS = ("large", "small", "tiny")
+
+# These formats are already deflated; recompressing them wastes time for no gain.
+PRECOMPRESSED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.zip')
+
+
+def collect_pack_sources(output_root):
+    """
+    Lazily yields (file_path, arcname) for every image that belongs in the
+    pack. Images keep their path relative to the output root (e.g.
+    tiny/atlas.png); textures.ini is added by export_texture_pack.
+    """
+    for subfolder in PACK_SUBFOLDERS:
+        folder = os.path.join(output_root, subfolder)
+        if not os.path.isdir(folder):
+            continue
+        for file_path in iter_files(folder, extensions=PRECOMPRESSED_EXTENSIONS):
+            arcname = os.path.relpath(file_path, output_root).replace(os.sep, "/")
+            yield file_path, arcname
+
+
+def resolve_ini_targets(ini_text, arcnames):
+    """
+    Points the texture targets in a textures.ini at the pack's entries.
+
+    phash_matcher writes bare Set B file names (hash = atlas.png), while
+    the pack keeps images under large/, small/ and tiny/. A target that is
+    not an entry itself but is the file name of exactly one entry is
+    rewritten to that entry's path. Other sections and lines are kept as-is.
+
+    Args:
+        ini_text (str): The textures.ini contents.
+        arcnames (iterable): The image entries in the pack.
+
+    Returns:
+        tuple: (ini_text, rewritten, unresolved), where rewritten counts the
+        rewritten targets and unresolved lists the targets that are missing
+        from the pack or match several entries.
+    """
+    arcnames = set(arcnames)
+    by_basename = {}
+    for arcname in arcnames:
+        by_basename.setdefault(arcname.rsplit("/", 1)[-1], []).append(arcname)
+
+    lines = []
+    rewritten = 0
+    unresolved = []
+    section = None
+    for line in ini_text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("[") and stripped.endswith("]"):
+            section = stripped[1:-1].strip().lower()
+        elif section == "hashes" and "=" in stripped and not stripped.startswith(("#", ";")):
+            key, target = (part.strip() for part in stripped.split("=", 1))
+            target_path = target.replace("\\", "/")
+            if target and target_path not in arcnames:
+                candidates = by_basename.get(target_path, [])
+                if len(candidates) == 1:
+                    line = f"{key} = {candidates[0]}"
+                    rewritten += 1
+                else:
+                    unresolved.append(target)
+        lines.append(line)
+
+    return "\n".join(lines) + "\n", rewritten, unresolved
+
+
+def _zip_date_time(mtime):
+    """Converts a file mtime to a zip timestamp (2 second resolution, 1980 or later)."""
+    date_time = time.localtime(mtime)[:6]
+    if date_time[0] < 1980:
+        return (1980, 1, 1, 0, 0, 0)
+    return date_time[:5] + (date_time[5] // 2 * 2,)
+
+
+def _new_zip_info(arcname, date_time):
+    """Creates the ZipInfo for an entry, storing already-compressed formats as-is."""
+    info = zipfile.ZipInfo(arcname, date_time=date_time)
+    if arcname.lower().endswith(PRECOMPRESSED_EXTENSIONS):
+        info.compress_type = zipfile.ZIP_STORED
+    else:
+        info.compress_type = zipfile.ZIP_DEFLATED
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def _prepare_entry(file_path, arcname, previous_info):
+    """
+    Runs on a worker thread. Decides whether a source file differs from its
+    entry in the previous pack and, if so, reads it into memory.
+
+    Returns:
+        dict: {"arcname", "file_path", "data", "info", "reused"}. "data" is
+        None when the previous pack's entry can be reused as-is. A file that
+        was touched but is byte-identical is also "reused", but comes back
+        with its data and an info carrying its current timestamp, so the
+        quick check matches it on the next export.
+    """
+    stat = os.stat(file_path)
+    date_time = _zip_date_time(stat.st_mtime)
+
+    entry = {"arcname": arcname, "file_path": file_path, "data": None, "info": None, "reused": True}
+
+    # Quick check: same size and timestamp means the entry is unchanged.
+    if (previous_info is not None and previous_info.file_size == stat.st_size
+            and tuple(previous_info.date_time) == date_time):
+        return entry
+
+    with open(file_path, 'rb') as f:
+        data = f.read()
+
+    # Slow check: the file was touched, but its bytes may still be identical.
+    entry["reused"] = (previous_info is not None and previous_info.file_size == len(data)
+                       and previous_info.CRC == zlib.crc32(data))
+    entry["data"] = data
+    entry["info"] = _new_zip_info(arcname, date_time)
+    return entry
+
+
+def _bounded_map(pool, func, items, window):
+    """
+    Like pool.map, but only keeps `window` tasks in flight so the results
+    (file contents) never pile up in memory. Results come back in order.
+    """
+    in_flight = deque()
+    for item in items:
+        in_flight.append(pool.submit(func, *item))
+        if len(in_flight) >= window:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+def export_texture_pack(output_root, pack_path, ini_path=None, workers=None, incremental=False):
+    """
+    Streams the pipeline outputs and textures.ini into a single PPSSPP
+    texture pack archive.
+
+    Args:
+        output_root (str): Folder holding the large/, small/ and tiny/ outputs.
+        pack_path (str): Path of the .zip pack to create.
+        ini_path (str): Path to the textures.ini to include, if any. It is
+            written last, with its targets checked against the pack's
+            entries (see resolve_ini_targets).
+        workers (int): Number of threads preparing entries. Defaults to
+            the number of CPUs.
+        incremental (bool): Reuse unchanged entries from an existing pack
+            at pack_path and only replace the ones that changed.
+
+    Returns:
+        dict: Counts of "written", "reused" and "removed" entries.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 4
+
+    previous_pack = None
+    previous_entries = {}
+    if incremental and os.path.exists(pack_path):
+        previous_pack = zipfile.ZipFile(pack_path, 'r')
+        previous_entries = {info.filename: info for info in previous_pack.infolist()}
+        print(f"Updating existing pack {pack_path} ({len(previous_entries)} entries).")
+
+    stats = {"written": 0, "reused": 0, "removed": 0}
+    seen = set()
+    partial_path = f"{pack_path}.partial"
+
+    def prepare(file_path, arcname):
+        return _prepare_entry(file_path, arcname, previous_entries.get(arcname))
+
+    # Reused entries stored with a newer timestamp; the pack must still be replaced
+    retimed = 0
+    completed = False
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool, \
+                zipfile.ZipFile(partial_path, 'w', compression=zipfile.ZIP_DEFLATED) as pack:
+            sources = collect_pack_sources(output_root)
+            for entry in _bounded_map(pool, prepare, sources, window=workers * 4):
+                arcname = entry["arcname"]
+                if arcname in seen:
+                    print(f"  Warning: Duplicate pack entry {arcname}, skipping {entry['file_path']}")
+                    continue
+                seen.add(arcname)
+
+                if entry["data"] is None:
+                    # Unchanged: carry the old entry over without touching the source.
+                    previous_info = previous_entries[arcname]
+                    info = _new_zip_info(arcname, tuple(previous_info.date_time))
+                    pack.writestr(info, previous_pack.read(previous_info))
+                    stats["reused"] += 1
+                elif entry["reused"]:
+                    # Same bytes, newer timestamp: store the current one
+                    pack.writestr(entry["info"], entry["data"])
+                    stats["reused"] += 1
+                    retimed += 1
+                else:
+                    pack.writestr(entry["info"], entry["data"])
+                    stats["written"] += 1
+
+                total = stats["written"] + stats["reused"]
+                if total % 500 == 0:
+                    print(f"  ...packed {total} entries.")
+
+            # textures.ini goes last, once every image entry is known.
+            if ini_path:
+                with open(ini_path, 'r', encoding='utf-8') as f:
+                    ini_text, rewritten, unresolved = resolve_ini_targets(f.read(), seen)
+                if rewritten:
+                    print(f"  Pointed {rewritten} textures.ini targets at their folders in the pack.")
+                if unresolved:
+                    print(f"  Warning: {len(unresolved)} textures.ini targets are not in the pack "
+                          f"or are ambiguous, e.g. {', '.join(sorted(set(unresolved))[:5])}")
+                ini_data = ini_text.encode("utf-8")
+                ini_date_time = _zip_date_time(os.stat(ini_path).st_mtime)
+                previous_info = previous_entries.get("textures.ini")
+                if (previous_info is not None and previous_info.file_size == len(ini_data)
+                        and previous_info.CRC == zlib.crc32(ini_data)):
+                    stats["reused"] += 1
+                    if tuple(previous_info.date_time) != ini_date_time:
+                        retimed += 1
+                else:
+                    stats["written"] += 1
+                pack.writestr(_new_zip_info("textures.ini", ini_date_time), ini_data)
+                seen.add("textures.ini")
+        completed = True
+    finally:
+        if previous_pack is not None:
+            previous_pack.close()
+        # Never leave a half-written pack behind after an error
+        if not completed and os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    stats["removed"] = len(set(previous_entries) - seen)
+    if previous_entries and not stats["written"] and not stats["removed"] and not retimed:
+        os.remove(partial_path)
+        print(f"Texture pack {pack_path} is already up to date ({stats['reused']} entries).")
+        return stats
+
+    os.replace(partial_path, pack_path)
+    print(f"Texture pack saved to {pack_path}: {stats['written']} written, "
+          f"{stats['reused']} reused, {stats['removed']} removed.")
+    return stats
+
+
+def main(argv=None, prog=None):
+    """Runs the command line interface. argv defaults to sys.argv[1:]."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog=prog, description="Export the pipeline outputs as a zipped PPSSPP texture pack.")
+    parser.add_argument("pack", type=str, help="Path of the texture pack to create, e.g. textures.zip")
+    parser.add_argument("--output-root", type=str, default="output",
+                        help="Folder holding the large/, small/ and tiny/ outputs (default: output)")
+    parser.add_argument("--ini", type=str, default=None, help="Path to the textures.ini to include.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of threads preparing entries.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only replace entries that changed since the pack was last exported.")
+
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.output_root):
+        print(f"Error: Output folder not found at '{args.output_root}'")
+        sys.exit(1)
+    if args.ini and not os.path.isfile(args.ini):
+        print(f"Error: textures.ini not found at '{args.ini}'")
+        sys.exit(1)
+
+    export_texture_pack(args.output_root, args.pack, args.ini, args.workers, args.incremental)
+
+
+if __name__ == "__main__":
+    main()